@@ -0,0 +1,259 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Runs the GCode analyzer engines over the synthetic corpus (see corpus.py) and records, for every file and engine,
+# wall time, peak RSS of the engine with its pool and whether the output matches the reference engine and the layers
+# in the file.
+#
+#    python benchmarks/analyzer_harness.py <corpus folder> [--sizes 1 16 128] [--engines native python python-parallel]
+#                                           [--engine name="command {file}"] [--output results.json]
+#
+# Engines are run as a subprocess with the same command line GCodeAnalyzer uses. The results are written as JSON,
+# together with the plugin version and the host, to be compared across releases.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NATIVE = os.path.join(ROOT, "octoprint_astroprint", "util", "AstroprintGCodeAnalyzer")
+PYTHON = os.path.join(ROOT, "octoprint_astroprint", "gCodeAnalyzer", "engine.py")
+
+ENGINES = {
+	"native": [NATIVE, "{file}", "1"],
+	"python": [sys.executable, PYTHON, "--jobs=1", "{file}", "1"],
+	"python-parallel": [sys.executable, PYTHON, "--jobs=0", "{file}", "1"],
+}
+
+#The RSS of the engine and its pool is sampled this often (secs)
+RSS_SAMPLE_INTERVAL = 0.05
+PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024 if hasattr(os, "sysconf") else 4
+
+#Differences allowed for the output to match the reference engine
+MAX_LAYER_DIFF = 1e-6 #upperPercent and time of every layer, fractions of the file and the print time
+MAX_RELATIVE_DIFF = 1e-3 #print time and filament
+
+def pluginVersion():
+	with open(os.path.join(ROOT, "setup.py")) as f:
+		match = re.search(r'^plugin_version\s*=\s*"([^"]+)"', f.read(), re.M)
+
+	return match.group(1) if match else None
+
+def gitCommit():
+	try:
+		return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def numpyVersion():
+	try:
+		import numpy
+		return numpy.__version__
+
+	except ImportError:
+		return None
+
+def treeRss(pid):
+	# RSS in KB of the process and all its descendants, from /proc. Pages shared by the processes of the pool are
+	# counted for each of them.
+	children = {}
+	rss = {}
+	for name in os.listdir("/proc"):
+		if not name.isdigit():
+			continue
+
+		try:
+			with open("/proc/%s/stat" % name) as f:
+				ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+			with open("/proc/%s/statm" % name) as f:
+				rss[int(name)] = int(f.read().split()[1]) * PAGE_KB
+
+		except (IOError, OSError, ValueError, IndexError):
+			#Gone meanwhile
+			continue
+
+		children.setdefault(ppid, []).append(int(name))
+
+	total = 0
+	pending = [pid]
+	while pending:
+		process = pending.pop()
+		total += rss.get(process, 0)
+		pending.extend(children.get(process, []))
+
+	return total
+
+def sampleRss(pid, done, peak):
+	while not done.is_set():
+		peak[0] = max(peak[0], treeRss(pid))
+		done.wait(RSS_SAMPLE_INTERVAL)
+
+def runEngine(command):
+	# Returns (output, wall time, peak RSS in KB, error). The peak RSS is the one of the whole process tree where /proc
+	# is there to sample it, the one of its biggest process (from wait4) otherwise or if higher.
+	with tempfile.TemporaryFile() as stderr:
+		start = time.time()
+		try:
+			p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+
+		except OSError as e:
+			return None, None, None, str(e)
+
+		peak = [0]
+		done = threading.Event()
+		sampler = None
+		if os.path.isdir("/proc/%d" % p.pid):
+			sampler = threading.Thread(target=sampleRss, args=(p.pid, done, peak))
+			sampler.daemon = True
+			sampler.start()
+
+		stdout = p.stdout.read()
+		p.stdout.close()
+
+		done.set()
+		if sampler:
+			sampler.join()
+
+		_, status, rusage = os.wait4(p.pid, 0)
+		elapsed = time.time() - start
+		p.returncode = os.waitstatus_to_exitcode(status)
+		rss = max(peak[0], rusage.ru_maxrss)
+
+		if p.returncode != 0:
+			stderr.seek(0)
+			return None, elapsed, rss, stderr.read().decode(errors="replace").strip() or "exit code %d" % p.returncode
+
+	try:
+		return json.loads(stdout.decode()), elapsed, rss, None
+
+	except ValueError:
+		return None, elapsed, rss, "bad output"
+
+def compare(output, reference):
+	# Differences between the output of two engines for the same file
+	layers = output.get("layers") or []
+	referenceLayers = reference.get("layers") or []
+
+	def relative(key):
+		if not reference[key]:
+			return abs(output[key])
+		return abs(output[key] - reference[key]) / abs(reference[key])
+
+	diff = {
+		"layerCount": output["layer_count"] == reference["layer_count"],
+		"printTime": relative("print_time"),
+		"filament": relative("total_filament"),
+		"upperPercent": max([abs(a["upperPercent"] - b["upperPercent"]) for a, b in zip(layers, referenceLayers)] or [0.0]),
+		"layerTime": max([abs(a["time"] - b["time"]) for a, b in zip(layers, referenceLayers)] or [0.0]),
+	}
+	diff["match"] = diff["layerCount"] and diff["upperPercent"] <= MAX_LAYER_DIFF and diff["layerTime"] <= MAX_LAYER_DIFF and diff["printTime"] <= MAX_RELATIVE_DIFF and diff["filament"] <= MAX_RELATIVE_DIFF
+	return diff
+
+def main():
+	parser = argparse.ArgumentParser(description="GCode analyzer benchmark harness")
+	parser.add_argument("folder", help="corpus folder, the missing files are generated")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[1, 16, 128], help="corpus sizes in MB")
+	parser.add_argument("--profiles", nargs="+", choices=sorted(corpus.PROFILES), help="corpus profiles, all by default")
+	parser.add_argument("--engines", nargs="+", default=["native", "python", "python-parallel"], help="engines to run: %s" % ", ".join(sorted(ENGINES)))
+	parser.add_argument("--engine", action="append", default=[], metavar='NAME="COMMAND {file}"', help="additional engine")
+	parser.add_argument("--reference", default="python", help="engine the others are compared with")
+	parser.add_argument("--output", default="analyzer_results.json", help="JSON results file")
+	args = parser.parse_args()
+
+	engines = [(name, ENGINES[name]) for name in args.engines]
+	for definition in args.engine:
+		name, command = definition.split("=", 1)
+		engines.append((name, shlex.split(command)))
+
+	entries = corpus.build(args.folder, args.sizes, args.profiles)
+	results = []
+	skipped = set()
+
+	print("%-28s %-16s %9s %11s %7s %6s %6s" % ("file", "engine", "time (s)", "tree RSS MB", "layers", "exact", "match"))
+	for entry in entries:
+		path = os.path.join(args.folder, entry["file"])
+		outputs = {}
+
+		for name, command in engines:
+			if name in skipped:
+				continue
+
+			output, elapsed, rss, error = runEngine([arg.replace("{file}", path) for arg in command])
+			result = {
+				"file": entry["file"],
+				"profile": entry["profile"],
+				"bytes": entry["bytes"],
+				"engine": name,
+				"wallTime": elapsed,
+				"peakRssKB": rss,
+				"error": error,
+			}
+
+			if error and elapsed is None:
+				#Can't be executed on this host
+				print("%-28s %-16s skipped: %s" % (entry["file"], name, error))
+				skipped.add(name)
+				continue
+
+			if output:
+				outputs[name] = output
+				result["layerCount"] = output["layer_count"]
+				result["printTime"] = output["print_time"]
+				result["planned"] = output.get("planned", False)
+				result["layersExact"] = output["layer_count"] == entry["layers"]
+
+			results.append(result)
+
+		reference = outputs.get(args.reference)
+		for result in results:
+			if result["file"] == entry["file"] and result["engine"] in outputs:
+				if reference and result["engine"] != args.reference:
+					result["reference"] = compare(outputs[result["engine"]], reference)
+
+				print("%-28s %-16s %9.2f %11.1f %7d %6s %6s" % (
+					entry["file"], result["engine"], result["wallTime"], result["peakRssKB"] / 1024.0, result["layerCount"],
+					result["layersExact"], result["reference"]["match"] if "reference" in result else "-"
+				))
+
+			elif result["file"] == entry["file"]:
+				print("%-28s %-16s failed: %s" % (entry["file"], result["engine"], result["error"]))
+
+	report = {
+		"date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+		"pluginVersion": pluginVersion(),
+		"commit": gitCommit(),
+		"host": {
+			"platform": platform.platform(),
+			"machine": platform.machine(),
+			"python": platform.python_version(),
+			"numpy": numpyVersion(),
+			"cpus": os.cpu_count(),
+		},
+		"reference": args.reference,
+		"tolerances": {"layer": MAX_LAYER_DIFF, "relative": MAX_RELATIVE_DIFF},
+		"results": results,
+	}
+
+	with open(args.output, "w") as f:
+		json.dump(report, f, indent=2)
+
+	print("Results written to %s" % args.output)
+
+if __name__ == "__main__":
+	main()
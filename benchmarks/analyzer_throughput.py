@@ -0,0 +1,88 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Throughput benchmark of the GCode analyzer engines.
+#
+#    python benchmarks/analyzer_throughput.py [--size MB] [--profile abs-0.2] [--file path.gcode] [--jobs 1 2 4]
+#
+# Both engines are run as a subprocess, exactly like GCodeAnalyzer does. The native binary is skipped when it can't be
+# executed on this host. The python engine is run once per number of jobs to see how it scales with the CPUs. The
+# synthetic file is generated as the corpus of the analyzer harness does (see corpus.py).
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NATIVE = os.path.join(ROOT, "octoprint_astroprint", "util", "AstroprintGCodeAnalyzer")
+PYTHON = os.path.join(ROOT, "octoprint_astroprint", "gCodeAnalyzer", "engine.py")
+
+def runEngine(command):
+	start = time.time()
+	try:
+		p = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	except OSError as e:
+		return None, None, str(e)
+
+	elapsed = time.time() - start
+	if p.returncode != 0:
+		return None, elapsed, p.stderr.decode(errors="replace").strip() or "exit code %d" % p.returncode
+
+	return json.loads(p.stdout.decode()), elapsed, None
+
+def main():
+	parser = argparse.ArgumentParser(description="GCode analyzer engines throughput benchmark")
+	parser.add_argument("--size", type=int, default=128, help="size in MB of the synthetic file")
+	parser.add_argument("--profile", default="abs-0.2", choices=sorted(corpus.PROFILES), help="corpus profile of the synthetic file")
+	parser.add_argument("--file", help="analyze this file instead of a synthetic one")
+	parser.add_argument("--jobs", type=int, nargs="+", default=[1], help="processes used by the python engine")
+	args = parser.parse_args()
+
+	tmpFile = None
+	if args.file:
+		path = args.file
+	else:
+		fd, tmpFile = tempfile.mkstemp(suffix=".gcode")
+		os.close(fd)
+		path = tmpFile
+		params = dict(corpus.PROFILES[args.profile])
+		params.pop("maxSizeMB", None)
+		print("Generating %d MB synthetic gcode (%s)..." % (args.size, args.profile))
+		corpus.generate(path, args.size, **params)
+
+	sizeMB = os.path.getsize(path) / (1024.0 * 1024.0)
+	results = {}
+
+	try:
+		engines = [("native", [NATIVE, path, "1"])]
+		engines += [("python/%d" % jobs, [sys.executable, PYTHON, "--jobs=%d" % jobs, path, "1"]) for jobs in args.jobs]
+
+		for name, command in engines:
+			data, elapsed, error = runEngine(command)
+			if error:
+				print("%-10s skipped: %s" % (name, error))
+				continue
+
+			results[name] = data
+			print("%-10s %8.2f s %8.2f MB/s  layers: %d  print time: %.0f s" % (name, elapsed, sizeMB / elapsed, data["layer_count"], data["print_time"]))
+
+		names = sorted(results)
+		for name in names[1:]:
+			print("%s layer count matches %s: %s" % (name, names[0], results[name]["layer_count"] == results[names[0]]["layer_count"]))
+
+	finally:
+		if tmpFile:
+			os.remove(tmpFile)
+
+if __name__ == "__main__":
+	main()
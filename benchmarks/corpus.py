@@ -0,0 +1,199 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Synthetic GCode corpus for the analyzer benchmarks.
+#
+#    python benchmarks/corpus.py <folder> [--sizes 1 16 128 1024] [--profiles abs-0.2 vase-0.2 ...]
+#
+# Every profile is generated in every size (MB). Files are generated with a fixed seed, so the same profile and size
+# are always the same file, and the ones already in the folder are reused. A manifest.json describing the files,
+# including the number of layers the analyzers should find, is written next to them.
+
+import argparse
+import json
+import math
+import os
+import random
+
+MANIFEST = "manifest.json"
+
+#Machine limits as PrusaSlicer writes them in the start gcode
+LIMITS_HEADER = "M201 X1000 Y1000 Z200 E5000\nM203 X200 Y200 Z12 E120\nM204 P1250 R1250 T1250\nM205 X8.00 Y8.00 Z0.40 E4.50\n"
+
+PROFILES = {
+	"abs-0.2": dict(layerHeight=0.2, limits=True),
+	"abs-0.1": dict(layerHeight=0.1),
+	"abs-0.3-zhop": dict(layerHeight=0.3, zHop=True),
+	"rel-0.2": dict(layerHeight=0.2, relativeE=True),
+	"multitool-0.2": dict(layerHeight=0.2, tools=2),
+	#Every turn of the spiral is split in segments going up, the analyzers see each of them as a layer so the layer
+	#list of big vase files only measures how the layer list is handled. Bigger sizes are skipped.
+	"vase-0.2": dict(layerHeight=0.2, vase=True, maxSizeMB=32),
+}
+
+class Writer(object):
+
+	def __init__(self, f, relativeE, seed):
+		self.f = f
+		self.relativeE = relativeE
+		self.random = random.Random(seed)
+		self.written = 0
+		self.e = 0.0
+
+	def write(self, text):
+		self.f.write(text)
+		self.written += len(text)
+
+	def extrude(self, x, y, amount, feedrate, z=None):
+		self.e += amount
+		e = amount if self.relativeE else self.e
+		if z is None:
+			self.write("G1 X%.3f Y%.3f E%.5f F%d\n" % (x, y, e, feedrate))
+		else:
+			self.write("G1 X%.3f Y%.3f Z%.3f E%.5f F%d\n" % (x, y, z, e, feedrate))
+
+	def retract(self, amount, feedrate=2400):
+		self.e -= amount
+		self.write("G1 E%.5f F%d\n" % (-amount if self.relativeE else self.e, feedrate))
+
+	def travel(self, x, y, z, zHop):
+		self.retract(0.8)
+		if zHop:
+			self.write("G1 Z%.3f F600\n" % (z + 0.4))
+		self.write("G0 X%.3f Y%.3f F9000\n" % (x, y))
+		if zHop:
+			self.write("G1 Z%.3f F600\n" % z)
+		self.retract(-0.8)
+
+def writeLayer(w, layer, z, tools, zHop):
+	# Perimeters of a square and zig-zag infill, split between the tools when there is more than one
+	rand = w.random
+	w.write(";LAYER:%d\n" % layer)
+	w.write("G1 Z%.3f F600\n" % z)
+
+	for tool in range(tools):
+		if tools > 1:
+			w.retract(2.0)
+			w.write("T%d\n" % tool)
+			w.retract(-2.0)
+
+		center = 60.0 + tool * 80.0
+		for perimeter in range(3):
+			half = 25.0 - perimeter * 0.45
+			w.travel(center - half, center - half, z, zHop)
+			for x, y in ((center + half, center - half), (center + half, center + half), (center - half, center + half), (center - half, center - half)):
+				w.extrude(x, y, 2 * half * 0.033, 1800)
+
+		w.travel(center - 24.0, center - 24.0, z, zHop)
+		rows = 120
+		for row in range(rows):
+			y = center - 24.0 + 48.0 * row / rows
+			x = center + 24.0 if row % 2 == 0 else center - 24.0
+			w.extrude(x, y, 48.0 * 0.033, rand.choice((2400, 3000, 3600)))
+
+def writeVase(w, target, layerHeight, segments=64):
+	# Spiral going up layerHeight every turn, with a solid bottom layer. Returns the layers the analyzers find, the
+	# bottom one and every segment of the spiral.
+	z = layerHeight
+	writeLayer(w, 0, z, 1, False)
+	radius = 30.0
+	turn = 1
+	while w.written < target:
+		w.write(";LAYER:%d\n" % turn)
+		for i in range(1, segments + 1):
+			angle = 2 * math.pi * i / segments
+			w.extrude(100.0 + radius * math.cos(angle), 100.0 + radius * math.sin(angle), 2 * math.pi * radius / segments * 0.033, 1200, z + layerHeight * i / segments)
+		z += layerHeight
+		turn += 1
+
+	return 1 + (turn - 1) * segments
+
+def generate(path, sizeMB, layerHeight=0.2, relativeE=False, tools=1, vase=False, zHop=False, limits=False, seed=1):
+	# Writes a file of about sizeMB and returns the number of layers in it
+	target = int(sizeMB * 1024 * 1024)
+
+	with open(path, "w") as f:
+		w = Writer(f, relativeE, seed)
+		w.write(";Generated by the AstroPrint analyzer benchmark corpus\n")
+		w.write("G21\nG90\n%s\n" % ("M83" if relativeE else "M82"))
+		if limits:
+			w.write(LIMITS_HEADER)
+		w.write("M104 S210\nM140 S60\nM190 S60\nM109 S210\nG28\nG92 E0\n")
+
+		if vase:
+			layers = writeVase(w, target, layerHeight)
+		else:
+			layers = 0
+			while w.written < target:
+				writeLayer(w, layers, layerHeight * (layers + 1), tools, zHop)
+				layers += 1
+
+		w.write("M104 S0\nM140 S0\nG28 X0\nM84\n")
+
+	return layers
+
+def build(folder, sizes, profiles=None):
+	# Generates the files missing in the folder and returns the manifest entries
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+
+	manifestPath = os.path.join(folder, MANIFEST)
+	known = {}
+	if os.path.isfile(manifestPath):
+		with open(manifestPath) as f:
+			known = dict((entry["file"], entry) for entry in json.load(f))
+
+	entries = []
+	for name in profiles or sorted(PROFILES):
+		params = dict(PROFILES[name])
+		maxSizeMB = params.pop("maxSizeMB", None)
+
+		skipped = [sizeMB for sizeMB in sizes if maxSizeMB and sizeMB > maxSizeMB]
+		if skipped:
+			print("Skipping %s in %s MB, it's only generated up to %d MB" % (name, ", ".join(str(sizeMB) for sizeMB in skipped), maxSizeMB))
+
+		for sizeMB in sizes:
+			if sizeMB in skipped:
+				continue
+
+			filename = "%s-%dmb.gcode" % (name, sizeMB)
+			path = os.path.join(folder, filename)
+			entry = known.get(filename)
+
+			#Vase files of older manifests don't have their layers
+			if not entry or entry["layers"] is None or not os.path.isfile(path) or os.path.getsize(path) != entry["bytes"]:
+				print("Generating %s..." % filename)
+				layers = generate(path, sizeMB, **params)
+				entry = {
+					"file": filename,
+					"profile": name,
+					"sizeMB": sizeMB,
+					"bytes": os.path.getsize(path),
+					"layers": layers,
+					"params": params
+				}
+
+			entries.append(entry)
+
+	known.update((entry["file"], entry) for entry in entries)
+	with open(manifestPath, "w") as f:
+		json.dump(sorted(known.values(), key=lambda entry: entry["file"]), f, indent=2)
+
+	return entries
+
+def main():
+	parser = argparse.ArgumentParser(description="Generate the synthetic GCode corpus")
+	parser.add_argument("folder")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[1, 16, 128], help="sizes in MB, up to 1024")
+	parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), help="all of them by default")
+	args = parser.parse_args()
+
+	for entry in build(args.folder, args.sizes, args.profiles):
+		print("%-28s %10d bytes  layers: %s" % (entry["file"], entry["bytes"], entry["layers"]))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,55 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Memory held by the per layer table of an analyzed job: list of dicts as decoded from the analyzer json vs LayerTable.
+#
+#    python benchmarks/layer_table_memory.py [--layers 1000 10000 50000]
+
+import argparse
+import importlib.util
+import json
+import os
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def loadModule(name, path):
+	#Loaded by path so the plugin package (and OctoPrint) doesn't need to be importable
+	spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+layers = loadModule("layers", "octoprint_astroprint/gCodeAnalyzer/layers.py")
+
+def analyzerJson(layerCount):
+	return json.dumps({"layers": [{"time": 1.0 / layerCount, "upperPercent": (i + 1.0) / layerCount} for i in range(layerCount)]})
+
+def measure(build):
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	obj = build()
+	retained = tracemalloc.get_traced_memory()[0] - before
+	tracemalloc.stop()
+	return obj, retained
+
+def main():
+	parser = argparse.ArgumentParser(description="Layer table memory usage")
+	parser.add_argument("--layers", type=int, nargs="+", default=[1000, 10000, 50000])
+	args = parser.parse_args()
+
+	print("%10s %14s %14s %8s" % ("layers", "dict list", "LayerTable", "saved"))
+	for layerCount in args.layers:
+		text = analyzerJson(layerCount)
+
+		dictList, dictBytes = measure(lambda: json.loads(text)["layers"])
+		table, tableBytes = measure(lambda: layers.LayerTable.fromLayerList(json.loads(text)["layers"]))
+
+		print("%10d %12.1f KB %12.1f KB %7.1f%%" % (layerCount, dictBytes / 1024.0, tableBytes / 1024.0, 100.0 * (dictBytes - tableBytes) / dictBytes))
+
+if __name__ == "__main__":
+	main()
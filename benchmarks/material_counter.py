@@ -0,0 +1,120 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Per line cost of the material counting done for every command OctoPrint sends to the printer, compared with the
+# time there is for every line at a given line rate: counting the command (gcodeSent) and what's left in OctoPrint's
+# send thread when the counting is done by the counter's thread (commandSent).
+#
+#    python benchmarks/material_counter.py [--sizes 4] [--profiles abs-0.2 rel-0.2 multitool-0.2] [--rate 1000]
+#
+# The commands of synthetic corpus files (see corpus.py) are fed to the MaterialCounter as the gcode sent hook
+# does, with comments and blank lines left out and the gcode already extracted, as OctoPrint gives them.
+
+import argparse
+import importlib.util
+import logging
+import os
+import tempfile
+import time
+
+import corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#At 250000 baud, with the lines of a typical slicer, OctoPrint doesn't send much more than this
+DEFAULT_LINE_RATE = 1000
+
+def loadModule(name, path):
+	#Loaded by path so the plugin package (and OctoPrint) doesn't need to be importable
+	spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+materialcounter = loadModule("materialcounter", "octoprint_astroprint/materialcounter/__init__.py")
+
+class ResourcePolicy(object):
+
+	def applyToCurrentThread(self, name):
+		pass
+
+class Plugin(object):
+
+	def get_logger(self):
+		return logging.getLogger("material_counter")
+
+	def get_resource_policy(self):
+		return ResourcePolicy()
+
+def commands(path):
+	result = []
+	with open(path) as f:
+		for line in f:
+			cmd = line.split(";", 1)[0].strip()
+			if cmd:
+				result.append(("T" if cmd[0] == "T" else cmd.split(None, 1)[0], cmd))
+
+	return result
+
+def run(lines, threaded):
+	counter = materialcounter.MaterialCounter(Plugin())
+	counter.startPrint()
+
+	if threaded:
+		#Only the sending thread is timed: the counting thread is kept waiting for the count lock while a batch that
+		#fits in the buffer is sent, and the batch is counted after
+		counter.start()
+		elapsed = 0.0
+		batchSize = materialcounter.BUFFER_SIZE - 1
+		for i in range(0, len(lines), batchSize):
+			with counter._countLock:
+				start = time.perf_counter()
+				for gcode, cmd in lines[i:i+batchSize]:
+					counter.commandSent(gcode, cmd)
+				elapsed += time.perf_counter() - start
+
+			counter.flush()
+
+	else:
+		gcodeSent = counter.gcodeSent
+		start = time.perf_counter()
+		for gcode, cmd in lines:
+			gcodeSent(gcode, cmd)
+		elapsed = time.perf_counter() - start
+
+	consumed = counter.consumedFilament
+	counter.shutdown()
+	return elapsed, consumed
+
+def main():
+	parser = argparse.ArgumentParser(description="Material counter per line cost")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[4], help="corpus sizes in MB")
+	parser.add_argument("--profiles", nargs="+", default=["abs-0.2", "rel-0.2", "multitool-0.2"], choices=sorted(corpus.PROFILES))
+	parser.add_argument("--rate", type=int, default=DEFAULT_LINE_RATE, help="lines sent per second")
+	parser.add_argument("--folder", help="corpus folder, a temporary one by default")
+	args = parser.parse_args()
+
+	folder = args.folder or tempfile.mkdtemp(prefix="astroprint-corpus-")
+	budget = 1e6 / args.rate
+
+	print("%-24s %-12s %10s %10s %12s %22s" % ("file", "mode", "lines", "us/line", "% of budget", "filament per tool (mm)"))
+	for entry in corpus.build(folder, args.sizes, args.profiles):
+		lines = commands(os.path.join(folder, entry["file"]))
+
+		for mode, threaded in (("gcodeSent", False), ("commandSent", True)):
+			elapsed, consumed = min((run(lines, threaded) for _ in range(3)), key=lambda r: r[0])
+			perLine = elapsed * 1e6 / len(lines)
+
+			print("%-24s %-12s %10d %10.2f %11.2f%% %22s" % (
+				entry["file"], mode, len(lines), perLine, 100.0 * perLine / budget,
+				" ".join("T%s:%.0f" % (tool, length) for tool, length in sorted(consumed.items()))
+			))
+
+	print("Budget per line at %d lines/s: %.0f us" % (args.rate, budget))
+
+if __name__ == "__main__":
+	main()
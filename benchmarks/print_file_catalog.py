@@ -0,0 +1,106 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Looking a print file of the catalog up by its OctoPrint path, as done on every current data update while printing:
+# scanning the catalog vs the path index of AstroprintDB, what building the index costs when the catalog is loaded and
+# what a change costs, as every change makes a new version of the catalog.
+#
+#    python benchmarks/print_file_catalog.py [--entries 1000 10000] [--iterations 2000]
+
+import argparse
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def loadModule(name, path):
+	#Loaded by path so the plugin package (and OctoPrint) doesn't need to be importable. The package is there without
+	#running its __init__, for the relative imports.
+	if "octoprint_astroprint" not in sys.modules:
+		package = types.ModuleType("octoprint_astroprint")
+		package.__path__ = [os.path.join(ROOT, "octoprint_astroprint")]
+		sys.modules["octoprint_astroprint"] = package
+
+	spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+	module = importlib.util.module_from_spec(spec)
+	sys.modules[name] = module
+	spec.loader.exec_module(module)
+	return module
+
+astroprintdb = loadModule("octoprint_astroprint.AstroprintDB", "octoprint_astroprint/AstroprintDB.py")
+
+class Plugin(object):
+
+	def __init__(self, dataFolder):
+		self.dataFolder = dataFolder
+
+	def get_plugin_data_folder(self):
+		return self.dataFolder
+
+	def get_logger(self):
+		return logging.getLogger("print_file_catalog")
+
+def catalog(entries):
+	return dict(("%032x" % i, {
+		"name": "Design %d" % i,
+		"octoPrintPath": "astroprint/design_%d.gcode" % i,
+		"printFileName": "design_%d.gcode" % i,
+		"renderedImage": "https://images.astroprint.com/%d.png" % i
+	}) for i in range(entries))
+
+def scan(printFiles, octoPrintPath):
+	#What the lookup did before the index
+	for printFile in printFiles:
+		if printFiles[printFile]["octoPrintPath"] == octoPrintPath:
+			return astroprintdb.AstroprintPrintFile(printFile, printFiles[printFile]["name"], printFiles[printFile]["octoPrintPath"], printFiles[printFile]["printFileName"], printFiles[printFile]["renderedImage"])
+	return None
+
+def perCall(func, iterations):
+	return min(timeit.repeat(func, number=iterations, repeat=3)) * 1e6 / iterations
+
+def main():
+	parser = argparse.ArgumentParser(description="Print file lookups by OctoPrint path")
+	parser.add_argument("--entries", type=int, nargs="+", default=[1000, 10000])
+	parser.add_argument("--iterations", type=int, default=2000)
+	args = parser.parse_args()
+
+	folder = tempfile.mkdtemp(prefix="astroprint-catalog-")
+	try:
+		db = astroprintdb.AstroprintDB(Plugin(folder))
+
+		print("%-8s %-10s %12s %12s %8s" % ("entries", "lookup", "scan us", "index us", "speedup"))
+		for entries in args.entries:
+			printFiles = catalog(entries)
+			db.savePrintFiles(printFiles)
+			index = perCall(lambda: astroprintdb.PrintFileCatalog(printFiles), max(args.iterations // 100, 1))
+			printFile = {"name": "New", "octoPrintPath": "astroprint/new.gcode", "printFileName": "new.gcode", "renderedImage": None}
+			change = perCall(lambda: db.catalog.withPrintFile("new", printFile), max(args.iterations // 100, 1))
+
+			for name, path in (("first", "astroprint/design_0.gcode"), ("last", "astroprint/design_%d.gcode" % (entries - 1)), ("missing", "astroprint/other.gcode")):
+				found = db.getPrintFileByOctoPrintPath(path)
+				assert (found and found.octoPrintPath) == (scan(printFiles, path) and path)
+
+				before = perCall(lambda: scan(printFiles, path), args.iterations)
+				after = perCall(lambda: db.getPrintFileByOctoPrintPath(path), args.iterations)
+				print("%-8d %-10s %12.2f %12.2f %7.1fx" % (entries, name, before, after, before / after))
+
+			print("%-8d building the index when the catalog is loaded: %.0f us" % (entries, index))
+			print("%-8d new version of the catalog for a change: %.0f us" % (entries, change))
+
+		db.close()
+
+	finally:
+		shutil.rmtree(folder, ignore_errors=True)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,103 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Cost of saving and deleting print files of the catalog: rewriting the whole print_files.yaml on every change (as
+# before the print file store) vs the SQLite print file store. The store only queues the changes in the thread making
+# them, the time of writing each burst of them in one transaction is shown apart.
+#
+#    python benchmarks/print_file_store.py [--entries 1000 10000] [--mutations 50] [--folder /path/on/the/sd/card]
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import yaml
+
+from print_file_catalog import astroprintdb, catalog, Plugin
+
+def legacySave(path, printFiles):
+	with open(path, "w") as infoFile:
+		yaml.safe_dump(printFiles, infoFile, default_flow_style=False, indent=4, allow_unicode=True)
+
+def runLegacy(folder, entries, mutations):
+	path = os.path.join(folder, "print_files.yaml")
+	printFiles = catalog(entries)
+	legacySave(path, printFiles)
+
+	start = time.perf_counter()
+	for i in range(mutations):
+		printFiles["new%d" % i] = {"name": "New %d" % i, "octoPrintPath": "astroprint/new_%d.gcode" % i, "printFileName": "new_%d.gcode" % i, "renderedImage": None}
+		legacySave(path, printFiles)
+	saved = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for i in range(mutations):
+		del printFiles["%032x" % i]
+		legacySave(path, printFiles)
+	deleted = time.perf_counter() - start
+
+	return saved, deleted, None
+
+def runStore(folder, entries, mutations):
+	db = astroprintdb.AstroprintDB(Plugin(folder))
+	db.savePrintFiles(catalog(entries))
+
+	start = time.perf_counter()
+	for i in range(mutations):
+		db.savePrintFile(astroprintdb.AstroprintPrintFile("new%d" % i, "New %d" % i, "astroprint/new_%d.gcode" % i, "new_%d.gcode" % i, None))
+	saved = time.perf_counter() - start
+
+	start = time.perf_counter()
+	db.flush()
+	written = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for i in range(mutations):
+		db.deletePrintFile("astroprint/design_%d.gcode" % i)
+	deleted = time.perf_counter() - start
+
+	start = time.perf_counter()
+	db.flush()
+	written += time.perf_counter() - start
+
+	#Everything is there when loaded again
+	db.close()
+	db = astroprintdb.AstroprintDB(Plugin(folder))
+	assert len(db.printFiles) == entries
+	db.close()
+
+	return saved, deleted, written
+
+def main():
+	parser = argparse.ArgumentParser(description="Print file catalog mutations")
+	parser.add_argument("--entries", type=int, nargs="+", default=[1000, 10000])
+	parser.add_argument("--mutations", type=int, default=50, help="print files saved, then deleted")
+	parser.add_argument("--folder", help="where the catalog is written, a temporary folder by default")
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.WARNING)
+
+	print("%-8s %-8s %14s %14s %16s %18s" % ("entries", "catalog", "save ms", "delete ms", "500 deletes (s)", "batch writes (ms)"))
+	for entries in args.entries:
+		for name, run in (("yaml", runLegacy), ("sqlite", runStore)):
+			folder = tempfile.mkdtemp(prefix="astroprint-store-", dir=args.folder)
+			try:
+				saved, deleted, written = run(folder, entries, args.mutations)
+
+			finally:
+				shutil.rmtree(folder, ignore_errors=True)
+
+			print("%-8d %-8s %14.2f %14.2f %16.2f %18s" % (
+				entries, name, saved * 1e3 / args.mutations, deleted * 1e3 / args.mutations, deleted * 500 / args.mutations,
+				"%.2f" % (written * 1e3) if written is not None else "-"
+			))
+
+if __name__ == "__main__":
+	main()
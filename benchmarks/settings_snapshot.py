@@ -0,0 +1,155 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Settings and printer profile lookups done on every temperature report, state update, /status and printer profile
+# request: looked up in OctoPrint's settings and profile manager on every call vs read from the SettingsSnapshot,
+# and what rebuilding the snapshot costs when they change.
+#
+#    python benchmarks/settings_snapshot.py [--extruders 1 2] [--iterations 20000]
+#
+# Needs OctoPrint installed, its settings and profile manager are created in a temporary folder.
+
+import argparse
+import importlib.util
+import os
+import shutil
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def loadModule(name, path):
+	#Loaded by path so the plugin package doesn't need to be importable
+	spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+settingssnapshot = loadModule("settingssnapshot", "octoprint_astroprint/settingssnapshot/__init__.py")
+
+#The plugin defaults looked up by the hot paths
+DEFAULTS = dict(
+	boxName = "astrobox",
+	printerModel = {'id' : "model", 'name' : "Model"},
+	filament = {'name' : "PLA", 'color' : "#ffffff"},
+	check_clear_bed = True,
+	max_nozzle_temp = 280,
+	max_bed_temp = 140
+)
+
+def temperatureReport(extruders):
+	data = {'bed': {'actual': 60.0, 'target': 60.0}}
+	for i in range(extruders):
+		data['tool%d' % i] = {'actual': 210.0, 'target': 210.0}
+
+	return data
+
+def legacyTemperature(profileManager, settings, data):
+	payload = { 'bed': { 'actual': data['bed']['actual'], 'target': data['bed']['target'] } }
+	dataProfile = profileManager.get_current_or_default()
+	for i in range(dataProfile['extruder']['count']):
+		tool = 'tool'+str(i)
+		if tool in data:
+			payload[tool] = { 'actual': data[tool]['actual'], 'target': data[tool]['target'] }
+
+	return payload
+
+def snapshotTemperature(snapshot, data):
+	payload = { 'bed': { 'actual': data['bed']['actual'], 'target': data['bed']['target'] } }
+	for tool in snapshot.toolKeys:
+		if tool in data:
+			payload[tool] = { 'actual': data[tool]['actual'], 'target': data[tool]['target'] }
+
+	return payload
+
+def legacyStatus(profileManager, settings):
+	#isBedClear and capabilities, then the /status settings
+	return (
+		settings.get(['check_clear_bed']),
+		settings.get(['check_clear_bed']),
+		settings.get(["boxName"]),
+		settings.get(["printerModel"]) if settings.get(['printerModel'])['id'] else None,
+		settings.get(["filament"]),
+		settings.global_get(["webcam", "flipV"]),
+		settings.global_get(["webcam", "flipH"]),
+		settings.global_get(["webcam", "rotate90"])
+	)
+
+def snapshotStatus(snapshot):
+	return (
+		snapshot.checkClearBed,
+		snapshot.checkClearBed,
+		snapshot.boxName,
+		snapshot.printerModel,
+		snapshot.filament,
+		snapshot.flipV,
+		snapshot.flipH,
+		snapshot.rotate90
+	)
+
+def legacyProfile(profileManager, settings):
+	printerProfile = profileManager.get_current_or_default()
+	return {
+		'driver': "marlin",
+		'extruder_count': printerProfile['extruder']['count'],
+		'max_nozzle_temp': settings.get(["max_nozzle_temp"]),
+		'max_bed_temp': settings.get(["max_bed_temp"]),
+		'heated_bed': printerProfile['heatedBed'],
+		'cancel_gcode': ['G28 X0 Y0'],
+		'invert_z': printerProfile['axes']['z']['inverted'],
+		'printerModel': settings.get(["printerModel"]) if settings.get(['printerModel'])['id'] else None,
+		'filament' : settings.get(["filament"])
+	}
+
+def perCall(func, iterations):
+	return min(timeit.repeat(func, number=iterations, repeat=3)) * 1e6 / iterations
+
+def main():
+	parser = argparse.ArgumentParser(description="Settings and printer profile lookups per update")
+	parser.add_argument("--extruders", type=int, nargs="+", default=[1, 2])
+	parser.add_argument("--iterations", type=int, default=20000)
+	args = parser.parse_args()
+
+	from octoprint.settings import settings as octoprintSettings
+	from octoprint.plugin import PluginSettings
+	from octoprint.printer.profile import PrinterProfileManager
+
+	basedir = tempfile.mkdtemp(prefix="astroprint-settings-")
+	try:
+		globalSettings = octoprintSettings(init=True, basedir=basedir)
+		settings = PluginSettings(globalSettings, "astroprint", defaults=DEFAULTS)
+		profileManager = PrinterProfileManager()
+
+		print("%-10s %-22s %12s %12s %8s" % ("extruders", "update", "lookups us", "snapshot us", "speedup"))
+		for extruders in args.extruders:
+			profile = profileManager.get_default()
+			profile['extruder']['count'] = extruders
+			profileManager.save(profile, allow_overwrite=True)
+			profileManager.select(profile['id'])
+
+			snapshot = settingssnapshot.SettingsSnapshot(settings, profileManager.get_current_or_default())
+			data = temperatureReport(extruders)
+			assert legacyTemperature(profileManager, settings, data) == snapshotTemperature(snapshot, data)
+			assert legacyProfile(profileManager, settings) == snapshot.profile()
+
+			for name, legacy, cached in (
+				("temperature report", lambda: legacyTemperature(profileManager, settings, data), lambda: snapshotTemperature(snapshot, data)),
+				("status", lambda: legacyStatus(profileManager, settings), lambda: snapshotStatus(snapshot)),
+				("printer profile", lambda: legacyProfile(profileManager, settings), lambda: snapshot.profile())
+			):
+				before = perCall(legacy, args.iterations)
+				after = perCall(cached, args.iterations)
+				print("%-10d %-22s %12.2f %12.2f %7.1fx" % (extruders, name, before, after, before / after))
+
+		rebuild = perCall(lambda: settingssnapshot.SettingsSnapshot(settings, profileManager.get_current_or_default()), args.iterations // 10)
+		print("Rebuilding the snapshot on a settings or profile change: %.2f us" % rebuild)
+
+	finally:
+		shutil.rmtree(basedir, ignore_errors=True)
+
+if __name__ == "__main__":
+	main()
@@ -439,6 +439,8 @@ class AstroprintCloud():
 				self.db.savePrintFile(file)
 				if printNow:
 					self.printFileIsDownloaded(file)
+				else:
+					self.plugin.analyzeAhead(self._file_manager.path_on_disk(FileDestinations.LOCAL, name))
 			return None
 
 		except octoprint.filemanager.storage.StorageError as e:
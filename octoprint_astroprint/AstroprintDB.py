@@ -9,6 +9,9 @@ import os
 import yaml
 import copy
 import codecs
+import threading
+
+from .PrintFileStore import PrintFileStore
 
 class AstroprintDB():
 
@@ -18,7 +21,9 @@ class AstroprintDB():
 		self.plugin = plugin
 		self._logger = plugin.get_logger()
 		self.infoPrintFiles = os.path.join(dataFolder,"print_files.yaml")
-		self.printFiles = {}
+		self.printFileStore = PrintFileStore(os.path.join(dataFolder,"print_files.db"), self._logger)
+		self._catalog = PrintFileCatalog({})
+		self._writeLock = threading.Lock() #Changes of the catalog are made one at a time
 		self.getPrintFiles()
 
 		self.infoUser = os.path.join(dataFolder,"user.yaml")
@@ -34,8 +39,7 @@ class AstroprintDB():
 			user['orgId'] = encrypt(user['orgId']) if user['orgId'] else None
 			user['groupId'] = encrypt(user['groupId']) if user['groupId'] else None
 
-		with open(self.infoUser, "w") as infoFile:
-			yaml.safe_dump({"user" : user}, infoFile, default_flow_style=False, indent=4, allow_unicode=True)
+		safeDump({"user" : user}, self.infoUser)
 
 		self.plugin.user = self.user
 
@@ -71,52 +75,134 @@ class AstroprintDB():
 		self.saveUser(None)
 
 	def getPrintFiles(self):
+		## Move the print files of the old yaml file to the print file store
+		if os.path.isfile(self.infoPrintFiles):
+			self.migratePrintFiles()
+
+		try:
+			with self._writeLock:
+				self._catalog = PrintFileCatalog(self.printFileStore.load())
+
+		except:
+			self._logger.error("There was an error loading the print files", exc_info= True)
+
+		self.plugin.printFiles = self.printFiles
+
+	def migratePrintFiles(self):
 		try:
 			with open(self.infoPrintFiles, "r") as f:
 				printFiles = yaml.safe_load(f)
-				if printFiles:
-					self.printFiles = printFiles
 
-		except IOError as e:
-			if e.errno == 2:
-				self._logger.info("No print files yaml: %s" % self.infoPrintFiles)
-			else:
-				self._logger.error("IOError error loading %s" % self.infoPrintFiles, exc_info= True)
+			if printFiles:
+				self.printFileStore.replaceAll(printFiles)
+
+			os.remove(self.infoPrintFiles)
+			self._logger.info("Print files moved from %s to the print file store" % self.infoPrintFiles)
 
 		except:
-			self._logger.info("There was an error loading %s" % self.infoPrintFiles, exc_info= True)
+			self._logger.error("There was an error moving the print files of %s" % self.infoPrintFiles, exc_info= True)
 
-		self.plugin.printFiles = self.printFiles
+	def flush(self):
+		self.printFileStore.flush()
+
+	def close(self):
+		self.printFileStore.close()
+
+	@property
+	def printFiles(self):
+		# Print files of the current catalog by printFileId, not to be modified
+		return self._catalog.printFiles
+
+	@property
+	def catalog(self):
+		return self._catalog
 
 	def savePrintFiles(self, printFiles):
-		self.printFiles = printFiles
-		with open(self.infoPrintFiles, "w") as infoFile:
-			yaml.safe_dump(printFiles, infoFile, default_flow_style=False, indent=4, allow_unicode=True)
-		self.plugin.printFiles = self.printFiles
+		with self._writeLock:
+			self._catalog = PrintFileCatalog(dict(printFiles))
+			self.printFileStore.replaceAll(printFiles)
+			self.plugin.printFiles = self.printFiles
 
 	def savePrintFile(self, printFile):
-		self.printFiles[printFile.printFileId] = {"name" : printFile.name, "octoPrintPath" : printFile.octoPrintPath, "printFileName" : printFile.printFileName, "renderedImage" : printFile.renderedImage}
-		self.savePrintFiles(self.printFiles)
+		entry = {"name" : printFile.name, "octoPrintPath" : printFile.octoPrintPath, "printFileName" : printFile.printFileName, "renderedImage" : printFile.renderedImage}
+		with self._writeLock:
+			self._catalog = self._catalog.withPrintFile(printFile.printFileId, entry)
+			self.printFileStore.save(printFile.printFileId, entry)
+			self.plugin.printFiles = self.printFiles
 
 	def deletePrintFile(self, path):
-		printFiles = {}
-		if self.printFiles:
-			for printFile in self.printFiles:
-				if self.printFiles[printFile]["octoPrintPath"] != path:
-					printFiles[printFile] = self.printFiles[printFile]
-			self.savePrintFiles(printFiles)
+		with self._writeLock:
+			catalog, ids = self._catalog.withoutPath(path)
+			if ids:
+				self._catalog = catalog
+				self.printFileStore.delete(ids)
+				self.plugin.printFiles = self.printFiles
 
 	def getPrintFileById(self, printFileId):
-		if self.printFiles and printFileId in self.printFiles:
-			return 	AstroprintPrintFile(printFileId, self.printFiles[printFileId]["name"], self.printFiles[printFileId]["octoPrintPath"], self.printFiles[printFileId]["printFileName"], self.printFiles[printFileId]["renderedImage"])
-		return None
+		return self._catalog.getPrintFileById(printFileId)
 
+	def getPrintFileByOctoPrintPath(self, octoPrintPath):
+		return self._catalog.getPrintFileByOctoPrintPath(octoPrintPath)
+
+class PrintFileCatalog():
+	# A version of the print file catalog: print files by printFileId and their ids by octoPrintPath, in catalog order.
+	# It's never modified once built, changes make a new version (sharing the entries not changed) that AstroprintDB
+	# swaps in, so it's read from any thread without locks.
+
+	__slots__ = ('printFiles', 'pathIndex')
+
+	def __init__(self, printFiles, pathIndex=None):
+		if pathIndex is None:
+			pathIndex = {}
+			for printFileId, printFile in printFiles.items():
+				pathIndex[printFile["octoPrintPath"]] = pathIndex.get(printFile["octoPrintPath"], ()) + (printFileId,)
+
+		self.printFiles = printFiles
+		self.pathIndex = pathIndex
+
+	def withPrintFile(self, printFileId, printFile):
+		printFiles = dict(self.printFiles)
+		pathIndex = dict(self.pathIndex)
+
+		previous = printFiles.get(printFileId)
+		if previous and previous["octoPrintPath"] != printFile["octoPrintPath"]:
+			ids = tuple(i for i in pathIndex[previous["octoPrintPath"]] if i != printFileId)
+			if ids:
+				pathIndex[previous["octoPrintPath"]] = ids
+			else:
+				del pathIndex[previous["octoPrintPath"]]
+
+		ids = pathIndex.get(printFile["octoPrintPath"], ())
+		if printFileId not in ids:
+			pathIndex[printFile["octoPrintPath"]] = ids + (printFileId,)
+
+		printFiles[printFileId] = printFile
+		return PrintFileCatalog(printFiles, pathIndex)
+
+	def withoutPath(self, octoPrintPath):
+		# Returns the version without the print files of the path and their ids
+		ids = self.pathIndex.get(octoPrintPath)
+		if not ids:
+			return self, ()
+
+		printFiles = dict(self.printFiles)
+		for printFileId in ids:
+			del printFiles[printFileId]
+
+		pathIndex = dict(self.pathIndex)
+		del pathIndex[octoPrintPath]
+		return PrintFileCatalog(printFiles, pathIndex), ids
+
+	def getPrintFileById(self, printFileId):
+		printFile = self.printFiles.get(printFileId)
+		if printFile:
+			return AstroprintPrintFile(printFileId, printFile["name"], printFile["octoPrintPath"], printFile["printFileName"], printFile["renderedImage"])
+		return None
 
 	def getPrintFileByOctoPrintPath(self, octoPrintPath):
-		if self.printFiles:
-			for printFile in self.printFiles:
-				if self.printFiles[printFile]["octoPrintPath"] == octoPrintPath:
-					return AstroprintPrintFile(printFile, self.printFiles[printFile]["name"], self.printFiles[printFile]["octoPrintPath"], self.printFiles[printFile]["printFileName"], self.printFiles[printFile]["renderedImage"])
+		ids = self.pathIndex.get(octoPrintPath)
+		if ids:
+			return self.getPrintFileById(ids[0])
 		return None
 
 class AstroprintPrintFile():
@@ -128,6 +214,16 @@ class AstroprintPrintFile():
 		self.printFileName = printFileName
 		self.renderedImage = renderedImage
 
+def safeDump(data, path):
+	# Written to a temporary file first and renamed over the old one, a crash while writing leaves the old one
+	tmpPath = path + ".tmp"
+	with open(tmpPath, "w") as f:
+		yaml.safe_dump(data, f, default_flow_style=False, indent=4, allow_unicode=True)
+		f.flush()
+		os.fsync(f.fileno())
+
+	os.replace(tmpPath, path)
+
 def encrypt(s):
     return codecs.encode(s, 'rot-13')
 
@@ -0,0 +1,135 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+import sqlite3
+import threading
+
+#Changes are written this many secs after the first one not written yet, together with the ones made meanwhile
+WRITE_DELAY = 0.5
+
+class PrintFileStore():
+	# Print file catalog on disk, a SQLite database in WAL mode so saving or deleting a print file writes only its
+	# row instead of the whole catalog. Entries are dicts as kept by AstroprintDB (name, octoPrintPath, printFileName,
+	# renderedImage) by printFileId, loaded in the order they were first saved.
+	#
+	# Saves and deletes are only queued in the thread making them, a timer writes them WRITE_DELAY secs later in a
+	# single transaction, so a burst of them (a folder deleted, many downloads finished) costs one write. Call flush
+	# to write them right away, close does.
+
+	def __init__(self, path, logger):
+		self._logger = logger
+		self._lock = threading.Lock()
+		self._pending = {} #printFileId: (deleted, printFile to save or None)
+		self._timer = None
+		self._closed = False
+		self._conn = sqlite3.connect(path, check_same_thread=False)
+		self._conn.execute("PRAGMA journal_mode=WAL")
+		self._conn.execute("PRAGMA synchronous=NORMAL") #A crash can lose the last commits in WAL mode but not corrupt the catalog
+		with self._conn:
+			self._conn.execute(
+				"CREATE TABLE IF NOT EXISTS print_file ("
+				"print_file_id TEXT PRIMARY KEY, name TEXT, octoprint_path TEXT, print_file_name TEXT, rendered_image TEXT)"
+			)
+			self._conn.execute("CREATE INDEX IF NOT EXISTS print_file_octoprint_path ON print_file (octoprint_path)")
+
+	def close(self):
+		with self._lock:
+			if self._closed:
+				return
+
+			self._write()
+			self._closed = True
+			self._conn.close()
+
+	def flush(self):
+		with self._lock:
+			self._write()
+
+	def load(self):
+		with self._lock:
+			self._write()
+			rows = self._conn.execute(
+				"SELECT print_file_id, name, octoprint_path, print_file_name, rendered_image FROM print_file ORDER BY rowid"
+			).fetchall()
+
+		return dict((row[0], {"name" : row[1], "octoPrintPath" : row[2], "printFileName" : row[3], "renderedImage" : row[4]}) for row in rows)
+
+	def save(self, printFileId, printFile):
+		with self._lock:
+			#Deleted before, it goes to the end of the catalog
+			previous = self._pending.get(printFileId)
+			self._pending[printFileId] = (previous[0] if previous else False, dict(printFile))
+			self._schedule()
+
+	def delete(self, printFileIds):
+		with self._lock:
+			for printFileId in printFileIds:
+				self._pending[printFileId] = (True, None)
+
+			self._schedule()
+
+	def replaceAll(self, printFiles):
+		# The whole catalog in a single transaction, used to migrate or load it in bulk. Written right away.
+		with self._lock, self._conn:
+			self._pending = {}
+			self._conn.execute("DELETE FROM print_file")
+			self._conn.executemany(
+				"INSERT INTO print_file (print_file_id, name, octoprint_path, print_file_name, rendered_image) VALUES (?, ?, ?, ?, ?)",
+				[self._row(printFileId, printFile) for printFileId, printFile in printFiles.items()]
+			)
+
+	def _schedule(self):
+		#Called with the lock held
+		if not self._timer and not self._closed:
+			self._timer = threading.Timer(WRITE_DELAY, self._delayedWrite)
+			self._timer.daemon = True
+			self._timer.start()
+
+	def _delayedWrite(self):
+		try:
+			self.flush()
+
+		except:
+			self._logger.error("There was an error writing the print files", exc_info= True)
+
+	def _write(self):
+		#Called with the lock held
+		if self._timer:
+			self._timer.cancel()
+			self._timer = None
+
+		if not self._pending or self._closed:
+			return
+
+		pending = self._pending
+		self._pending = {}
+		try:
+			with self._conn:
+				for printFileId, (deleted, printFile) in pending.items():
+					if deleted:
+						self._conn.execute("DELETE FROM print_file WHERE print_file_id = ?", (printFileId,))
+
+					if printFile:
+						self._save(printFileId, printFile)
+
+		except:
+			#Rolled back, they are written with the next ones
+			self._pending = pending
+			raise
+
+	def _save(self, printFileId, printFile):
+		#Updated in place to keep its position in the catalog, UPSERT isn't there in older SQLite versions
+		row = self._row(printFileId, printFile)
+		cursor = self._conn.execute(
+			"UPDATE print_file SET name = ?, octoprint_path = ?, print_file_name = ?, rendered_image = ? WHERE print_file_id = ?",
+			row[1:] + row[:1]
+		)
+		if cursor.rowcount == 0:
+			self._conn.execute("INSERT INTO print_file (print_file_id, name, octoprint_path, print_file_name, rendered_image) VALUES (?, ?, ?, ?, ?)", row)
+
+	def _row(self, printFileId, printFile):
+		return (printFileId, printFile.get("name"), printFile.get("octoPrintPath"), printFile.get("printFileName"), printFile.get("renderedImage"))
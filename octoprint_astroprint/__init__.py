@@ -13,15 +13,22 @@ import os
 import yaml
 import re
 import uuid
+import threading
 
 
 from .AstroprintCloud import AstroprintCloud
 from .AstroprintDB import AstroprintDB
+from .gCodeAnalyzer import AnalyzerService
+from .gCodeAnalyzer.cache import AnalysisCache
+from .gCodeAnalyzer.limits import MotionLimits, LIMIT_COMMANDS
+from .layertracker import LayerTracker
 from .SqliteDB import SqliteDB
 from .boxrouter import boxrouterManager
 from .cameramanager import cameraManager
 from .materialcounter import MaterialCounter
 from .printerlistener import PrinterListener
+from .resourcepolicy import ResourcePolicy
+from .settingssnapshot import SettingsSnapshot
 
 from octoprint.server.util.flask import restricted_access
 from octoprint.server import admin_permission
@@ -46,6 +53,9 @@ from flask_login import user_logged_in, user_logged_out
 NO_CONTENT = ("", 204)
 OK = ("", 200)
 
+#Motion limits changed by the commands sent to the printer are saved this many secs after the first change
+MOTION_LIMITS_SAVE_DELAY = 60
+
 class JsonEncoder(json.JSONEncoder):
     def default(self, obj):
         return obj.__dict__
@@ -89,6 +99,13 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 		self.astroprintCloud = None
 		self.cameraManager = None
 		self.materialCounter= None
+		self.layerTracker = None
+		self.analysisCache = None
+		self.analyzerService = None
+		self.resourcePolicy = None
+		self.settingsSnapshot = None
+		self._motionLimits = None
+		self._motionLimitsTimer = None
 		self._printerListener = None
 		self.groupId = None
 		self.orgId = None
@@ -112,6 +129,9 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 		user_logged_in.connect(logInHandler)
 		user_logged_out.connect(logOutHandler)
 
+		self.updateSettingsSnapshot()
+		self._motionLimits = MotionLimits.fromDict(self._settings.get(["motion_limits"]))
+
 	@property
 	def boxId(self):
 		if not self._boxId:
@@ -138,14 +158,19 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 						'allowPrintFile',  	# Support for printing a printfile not belonging to any design
 						'acceptPrintJobId' # Accept created print job from cloud,
 						]
-		if self._settings.get(["check_clear_bed"]) :
+		if self.settingsSnapshot.checkClearBed :
 			capabilities.append('cleanState') # Support bed not clean state
 		return capabilities
 
 	def on_startup(self, host, port, *args, **kwargs):
 		self._logger.info("Starting AstoPrint Plugin")
+		self.resourcePolicy = ResourcePolicy(self)
 		self.register_printer_listener()
 		self.db = AstroprintDB(self)
+		self.analysisCache = AnalysisCache(self, self._settings.get_int(['analysis_cache_size']))
+		self.analyzerService = AnalyzerService(self)
+		self.analyzerService.start()
+		self.analyzerService.backfill(self._settings.get_int(['analysis_cache_size']))
 		if not self._settings.get(['check_clear_bed']):
 				self.set_bed_clear(True)
 
@@ -164,6 +189,8 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 			self.astroprintCloud.connectBoxrouter()
 		self.cameraManager.astroprintCloud = self.astroprintCloud
 		self.materialCounter = MaterialCounter(self)
+		self.materialCounter.start()
+		self.layerTracker = LayerTracker(self, self._printerListener.liveLayerChanged)
 		baseurl = octoprint_client.build_base_url(host, port)
 		self._logger.info("AstoPrint Plugin started, avalible in %s" % baseurl )
 
@@ -177,7 +204,16 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 		#clear al process we created
 		self.cameraManager.shutdown()
 		self.astroprintCloud.downloadmanager.shutdown()
+		if self.astroprintCloud.bm:
+			self.astroprintCloud.bm.shutdown()
+		self.analyzerService.shutdown()
+		if self.materialCounter:
+			self.materialCounter.shutdown()
+		if self._motionLimitsTimer:
+			self.saveMotionLimits()
 		self.unregister_printer_listener()
+		if self.db:
+			self.db.close()
 
 	def get_logger(self):
 		return self._logger
@@ -185,9 +221,23 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 	def get_printer(self):
 		return self._printer
 
+	def get_settings_snapshot(self):
+		return self.settingsSnapshot
+
+	def updateSettingsSnapshot(self):
+		# Called when the plugin settings or the printer profile change, the ones reading the current snapshot keep
+		# the one they took
+		self.settingsSnapshot = SettingsSnapshot(self._settings, self._printer_profile_manager.get_current_or_default())
+
+	def saveSetting(self, path, value):
+		# Every write of the plugin settings goes through here so the snapshot is never behind them
+		self._settings.set(path, value)
+		self._settings.save()
+		self.updateSettingsSnapshot()
+
 	@property
 	def isBedClear(self):
-		if self._settings.get(['check_clear_bed']):
+		if self.settingsSnapshot.checkClearBed:
 			return self._bed_clear
 		else:
 			return True
@@ -195,8 +245,7 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 	def set_bed_clear(self, clear, sendUpdate = False):
 		if clear != self._bed_clear:
 			self._bed_clear = clear
-			self._settings.set(['bedClear'], clear)
-			self._settings.save()
+			self.saveSetting(['bedClear'], clear)
 			self.send_event("bedclear", clear)
 			if sendUpdate and self.astroprintCloud and self.astroprintCloud.bm:
 				self.astroprintCloud.sendCurrentData()
@@ -204,6 +253,43 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 	def get_printer_listener(self):
 		return self._printerListener
 
+	def get_analysis_cache(self):
+		return self.analysisCache
+
+	def get_analyzer_service(self):
+		return self.analyzerService
+
+	def get_resource_policy(self):
+		return self.resourcePolicy
+
+	def analyzeAhead(self, filename):
+		if self.analyzerService:
+			self.analyzerService.analyzeAhead(filename)
+
+	def get_motion_limits(self):
+		return self._motionLimits.copy()
+
+	def captureMotionLimits(self, gcode, cmd):
+		# Motion limits sent to the printer are kept to plan the moves of the next analyses. Called in the thread
+		# sending the commands, so they are only changed in memory and saved later by a timer.
+		limits = self._motionLimits.copy()
+		if limits.update(gcode, cmd.split()[1:]):
+			self._motionLimits = limits
+			if not self._motionLimitsTimer:
+				self._motionLimitsTimer = threading.Timer(MOTION_LIMITS_SAVE_DELAY, self.saveMotionLimits)
+				self._motionLimitsTimer.daemon = True
+				self._motionLimitsTimer.start()
+
+	def saveMotionLimits(self):
+		if self._motionLimitsTimer:
+			self._motionLimitsTimer.cancel()
+			self._motionLimitsTimer = None
+
+		limits = self._motionLimits.toDict()
+		if limits != self._settings.get(["motion_limits"]):
+			self._logger.info("Saving the motion limits changed by the commands sent to the printer")
+			self.saveSetting(["motion_limits"], limits)
+
 	def get_settings(self):
 		return self._settings
 
@@ -271,6 +357,31 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 			#Adittional printer settings
 			max_nozzle_temp = 280, #only for being set by AstroPrintCloud, it wont affect octoprint settings
 			max_bed_temp = 140,
+			#Temperature reports sent to AstroPrint: changes of the actual temperatures within the deadband (C, for the bed,
+			#all the tools or tool0, tool1...) aren't sent and no more than max_rate reports are sent a second (0 for no
+			#limit), the last one held back is sent when the rate allows it. Changes of the targets are sent right away.
+			temperature_updates = dict(
+				deadband = dict(bed = 0.5, tool = 0.5),
+				max_rate = 1.0
+			),
+			#GCode analyzer used for layer information: native, python or auto (native with fallback to python, python
+			#for files big enough to split across CPUs)
+			analyzer_engine = "auto",
+			analysis_cache_size = 50, #analyzed files kept in the plugin data folder
+			analyzer_jobs = 0, #processes the python engine splits big files across, 0 for one per available CPU
+			#Firmware motion limits the python engine plans the moves with when NumPy is installed (the planner extra),
+			#in mm/s, mm/s^2, X Y Z E, updated with the M201/M203/M204/M205 commands sent to the printer
+			motion_limits = MotionLimits().toDict(),
+			#Applied to the analyzer process and the plugin worker threads so they don't slow down the serial communication
+			resource_policy = dict(
+				enabled = True,
+				nice = 10,
+				io_class = 2, #2: best effort, 3: idle
+				io_priority = 7, #0 (highest) to 7 (lowest), only for the best effort class
+				cpu_affinity = None, #list of CPUs, ex: [2, 3]. None to use all of them
+				analyzer_memory_limit = 512, #MB, 0 for no limit
+				analyzer_time_limit = 900, #secs, 0 for no limit
+			),
 		)
 
 	def get_template_vars(self):
@@ -333,6 +444,7 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 
 	def unregister_printer_listener(self):
 		self._printer.unregister_callback(self._printerListener)
+		self._printerListener.shutdown()
 		self._printerListener = None
 
 	def on_event(self, event, payload):
@@ -362,6 +474,13 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 			Events.MOVIE_FAILED
 		]
 
+		if event in (Events.SETTINGS_UPDATED, Events.PRINTER_PROFILE_MODIFIED, Events.CONNECTED):
+			#Connecting can select another printer profile
+			self.updateSettingsSnapshot()
+
+		if event == Events.SETTINGS_UPDATED and not self._motionLimitsTimer:
+			self._motionLimits = MotionLimits.fromDict(self._settings.get(["motion_limits"]))
+
 		if event in cameraSuccessEvents:
 			self.cameraManager.cameraConnected()
 
@@ -372,6 +491,10 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 			if payload['storage'] == 'local':
 				self.astroprintCloud.db.deletePrintFile(payload['path'])
 
+		elif event == Events.FILE_ADDED:
+			if payload['storage'] == 'local' and 'gcode' in payload['type']:
+				self.analyzeAhead(self._file_manager.path_on_disk(FileDestinations.LOCAL, payload['path']))
+
 		elif event == Events.CONNECTED:
 			self.send_event("canPrint", True)
 
@@ -383,6 +506,7 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 				self.astroprintCloud.updatePrintJob("failed", self.materialCounter.totalConsumedFilament)
 			self.astroprintCloud.currentPrintingJob = None
 			self.cameraManager.stop_timelapse()
+			self._printerListener.cancelAnalysis()
 			self._analyzed_job_layers = None
 
 		elif event == Events.PRINT_DONE:
@@ -400,6 +524,7 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 				self.astroprintCloud.printStarted(payload['name'], payload['path'])
 
 			self.materialCounter.startPrint()
+			self.layerTracker.startPrint()
 			file = self._file_manager.path_on_disk(FileDestinations.LOCAL, payload['path'])
 			self._printerListener.startPrint(file)
 		if  event in printEvents:
@@ -424,12 +549,14 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 		return tool
 
 	def count_material(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
-		if self.materialCounter:
-			if (gcode):
-				gcodeHandler = "_gcode_" + gcode
-				if hasattr(self.materialCounter, gcodeHandler):
-					materialCounter = getattr(self.materialCounter, gcodeHandler,None)
-					materialCounter(cmd)
+		if gcode in LIMIT_COMMANDS:
+			self.captureMotionLimits(gcode, cmd)
+
+		if self.layerTracker and gcode:
+			self.layerTracker.gcodeSent(gcode, cmd)
+
+		if self.materialCounter and gcode:
+			self.materialCounter.commandSent(gcode, cmd)
 
 
 	def is_blueprint_protected(self):
@@ -539,8 +666,7 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 	@admin_permission.require(403)
 	def changeboxroutername(self):
 		name = request.json['name']
-		self._settings.set(['boxName'], name)
-		self._settings.save()
+		self.saveSetting(['boxName'], name)
 		if self.astroprintCloud and self.astroprintCloud.bm:
 			data = {
 				"name": name
@@ -570,8 +696,7 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 	@admin_permission.require(403)
 	def changeprinter(self):
 		printer = request.json['printerModel']
-		self._settings.set(['printerModel'], printer)
-		self._settings.save()
+		self.saveSetting(['printerModel'], printer)
 		data = {
 			"printerModel": printer
 		}
@@ -580,8 +705,7 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 	@octoprint.plugin.BlueprintPlugin.route("/changeprinter", methods=["DELETE"])
 	@admin_permission.require(403)
 	def deleteprinter(self):
-		self._settings.set(['printerModel'], {'id' : None, 'name' : None})
-		self._settings.save()
+		self.saveSetting(['printerModel'], {'id' : None, 'name' : None})
 		data = {
 			"printerModel": None
 		}
@@ -591,16 +715,14 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 	@admin_permission.require(403)
 	def changefilament(self):
 		filament = request.json['filament']
-		self._settings.set(['filament'], filament)
-		self._settings.save()
+		self.saveSetting(['filament'], filament)
 		self.astroprintCloud.bm.triggerEvent('filamentChanged', {'filament' : filament})
 		return jsonify({"Filament updated" : True }), 200, {'ContentType':'application/json'}
 
 	@octoprint.plugin.BlueprintPlugin.route("/changefilament", methods=["DELETE"])
 	@admin_permission.require(403)
 	def removefilament(self):
-		self._settings.set(['filament'], {'name' : None, 'color' : None})
-		self._settings.save()
+		self.saveSetting(['filament'], {'name' : None, 'color' : None})
 		self.astroprintCloud.bm.triggerEvent('filamentChanged', {'filament' : {'name' : None, 'color' : None}})
 		return jsonify({"Filament removed" : True }), 200, {'ContentType':'application/json'}
 
@@ -649,6 +771,7 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 	def getStatus(self):
 
 		fileName = None
+		snapshot = self.settingsSnapshot
 
 		if self._printer.is_printing():
 			currentJob = self._printer.get_current_job()
@@ -657,17 +780,17 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 		return Response(
 			json.dumps({
 				'id': self.boxId,
-				'name': self._settings.get(["boxName"]),
+				'name': snapshot.boxName,
 				'printing': self._printer.is_printing() or self._printer.is_paused(),
 				'fileName': fileName,
-				'printerModel': self._settings.get(["printerModel"]) if self._settings.get(['printerModel'])['id']  else None,
-				'filament' : self._settings.get(["filament"]),
+				'printerModel': snapshot.printerModel,
+				'filament' : snapshot.filament,
 				'material': None,
 				'operational': self._printer.is_operational(),
 				'ready_to_print': self.isBedClear and self._printer.is_operational() and not (self._printer.is_printing() or self._printer.is_paused()),
-				"flipV" : self._settings.global_get(["webcam", "flipV"]),
-				'flipH' : self._settings.global_get(["webcam", "flipH"]),
-				"rotate90" : self._settings.global_get(["webcam", "rotate90"]),
+				"flipV" : snapshot.flipV,
+				'flipH' : snapshot.flipH,
+				"rotate90" : snapshot.rotate90,
 				'paused': self._printer.is_paused(),
 				'camera': True, #self.cameraManager.cameraActive,
 				'remotePrint': True,
@@ -680,19 +803,7 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 	@octoprint.plugin.BlueprintPlugin.route("/api/printer-profile", methods=["GET"])
 	@admin_permission.require(403)
 	def printer_profile_patch(self):
-		printerProfile = self._printer_profile_manager.get_current_or_default()
-		profile = {
-			'driver': "marlin", #At the moment octopi only supports marlin
-			'extruder_count': printerProfile['extruder']['count'],
-			'max_nozzle_temp': self._settings.get(["max_nozzle_temp"]),
-			'max_bed_temp': self._settings.get(["max_bed_temp"]),
-			'heated_bed': printerProfile['heatedBed'],
-			'cancel_gcode': ['G28 X0 Y0'],#ToDo figure out how to get it from snipet
-			'invert_z': printerProfile['axes']['z']['inverted'],
-			'printerModel': self._settings.get(["printerModel"]) if self._settings.get(['printerModel'])['id']  else None,
-			'filament' : self._settings.get(["filament"])
-		}
-		return jsonify(profile)
+		return jsonify(self.settingsSnapshot.profile())
 
 	@octoprint.plugin.BlueprintPlugin.route('/api/astroprint', methods=['DELETE'])
 	@admin_permission.require(403)
@@ -709,6 +820,15 @@ class AstroprintPlugin(octoprint.plugin.SettingsPlugin,
 			"state": currentData["state"]["text"]
 		})
 
+	@octoprint.plugin.BlueprintPlugin.route('/api/job/layer/<int:layer>', methods=['GET'])
+	@admin_permission.require(403)
+	def jobLayer(self, layer):
+		gcode = self._printerListener.get_layer_gcode(layer) if self._printer.is_printing() or self._printer.is_paused() else None
+		if gcode is None:
+			return jsonify({"error" : "Layer not available"}), 404, {'ContentType':'application/json'}
+
+		return Response(gcode, mimetype= 'text/plain')
+
 # If you want your plugin to be registered within OctoPrint under a different name than what you defined in setup.py
 # ("OctoPrint-PluginSkeleton"), you may define that here. Same goes for the other metadata derived from setup.py that
 # can be overwritten via __plugin_xyz__ control properties. See the documentation for that.
@@ -5,28 +5,6 @@ __author__ = "AstroPrint Product Team <product@astroprint.com>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
 
-# --- Python 3.13 compatibility patch (ws4py expects ssl.wrap_socket) ---
-import ssl
-
-if not hasattr(ssl, "wrap_socket"):
-	def _wrap_socket(sock, *args, **kwargs):
-		"""
-		Backport ssl.wrap_socket using SSLContext.wrap_socket for Python 3.13+.
-
-		ws4py still calls ssl.wrap_socket. Python 3.13 removed it.
-		We also enforce server_hostname for SNI/hostname verification.
-		"""
-		ctx = ssl.create_default_context()
-
-		# ws4py often does NOT pass server_hostname; Python requires it if check_hostname=True.
-		server_hostname = kwargs.pop("server_hostname", None) or "boxrouter.astroprint.com"
-
-		return ctx.wrap_socket(sock, server_hostname=server_hostname)
-
-	ssl.wrap_socket = _wrap_socket
-# --- End patch ---
-
-
 # singleton
 _instance = None
 
@@ -36,125 +14,129 @@ def boxrouterManager(plugin):
 		_instance = AstroprintBoxRouter(plugin)
 	return _instance
 
+import asyncio
 import json
-import threading
-import socket
 import os
 import sys
 import weakref
 import uuid
 
-from time import sleep, time
-
-from ws4py.client.threadedclient import WebSocketClient
-from ws4py.messaging import PingControlMessage
+from tornado.websocket import websocket_connect, WebSocketClosedError
 
 import octoprint.util
 
+from .eventloop import EventLoop
 from .handlers import BoxRouterMessageHandler
 from .events import EventSender
 
-LINE_CHECK_STRING = 'box'
+#The line is checked with a ping this often (secs), it's considered down when the pong doesn't come back
+LINE_CHECK_INTERVAL = 30
+CONNECT_TIMEOUT = 30
 
-class AstroprintBoxRouterClient(WebSocketClient):
-	def __init__(self, hostname, router, plugin):
-		self.connected = False
+class AstroprintBoxRouterClient(object):
+	# Websocket connection to the box router, run by the router's event loop: connecting, reading and dispatching the
+	# messages and the pings checking the line all happen in the loop's thread. send and terminate can be called from
+	# any thread.
+
+	def __init__(self, hostname, router, plugin, eventLoop):
+		self.terminated = False
+		self._address = hostname
+		self._eventLoop = eventLoop
+		self._conn = None
 		self._printerListener = plugin.get_printer_listener()
 		self._printer = plugin.get_printer()
-		self._lastReceived = 0
-		self._lineCheck = None
 		self._error = False
 		self._weakRefRouter = weakref.ref(router)
 		self.plugin = plugin
 		self._logger = self.plugin.get_logger()
-		self._condition = threading.Condition()
 		self._messageHandler = BoxRouterMessageHandler(self._weakRefRouter, self)
-		super(AstroprintBoxRouterClient, self).__init__(hostname)
 
 	def get_printer_listener(self):
 		return self._printerListener
 
-	def __del__(self):
-		router = self._weakRefRouter()
-		router.unregisterEvents()
-
-	def send(self, data):
-		with self._condition:
-			if not self.terminated:
-				try:
-					super(AstroprintBoxRouterClient, self).send(data)
+	def callLater(self, delay, callback, args=None):
+		timer = self._eventLoop.timer(delay, callback, args)
+		timer.start()
+		return timer
 
-				except socket.error as e:
-					self._logger.error('Error raised during send: %s' % e)
+	def execute(self, callback, *args):
+		# Blocking work of the message handlers is run out of the loop's thread, see EventLoop.execute
+		return self._eventLoop.execute(callback, *args)
 
-					self._error = True
+	async def connect(self):
+		self._conn = await websocket_connect(self._address, connect_timeout=CONNECT_TIMEOUT, ping_interval=LINE_CHECK_INTERVAL)
+		if self.terminated:
+			#Terminated while connecting
+			self._conn.close()
+			self._conn = None
+			raise WebSocketClosedError()
 
-					#Something happened to the link. Let's try to reset it
-					self.close()
+		#Starts reading after the router has seen the connection open
+		asyncio.ensure_future(self._readMessages())
 
-	def ponged(self, pong):
-		if str(pong) == LINE_CHECK_STRING:
-			self.outstandingPings -= 1
+	def send(self, data):
+		self._eventLoop.call(self._write, data)
 
-	def lineCheck(self, timeout=30):
-		while not self.terminated:
-			sleep(timeout)
-			if self.terminated:
-				break
+	def terminate(self):
+		self.terminated = True
+		self._eventLoop.call(self._close)
 
-			if self.outstandingPings > 0:
-				self._logger.error('The line seems to be down')
+	def _write(self, data):
+		if self.terminated or not self._conn:
+			return
 
-				router = self._weakRefRouter()
-				router.close()
-				router._doRetry()
+		try:
+			self._conn.write_message(data).add_done_callback(self._written)
+
+		except WebSocketClosedError as e:
+			self._linkError(e)
+
+	def _written(self, future):
+		if not future.cancelled() and future.exception():
+			self._linkError(future.exception())
+
+	def _linkError(self, e):
+		if not self._error:
+			self._logger.error('Error raised during send: %s' % e)
+			self._error = True
+
+			#Something happened to the link. Let's try to reset it
+			self._close()
+
+	def _close(self):
+		if self._conn:
+			self._conn.close()
+			self._conn = None
+
+	async def _readMessages(self):
+		conn = self._conn
+		while True:
+			#None when closed: by the remote, by us or because the line check failed
+			m = await conn.read_message()
+			if m is None:
 				break
 
-			if time() - self._lastReceived > timeout:
-				try:
-					self.send(PingControlMessage(data=LINE_CHECK_STRING))
-					self.outstandingPings += 1
-
-				except socket.error:
-					self._logger.error("Line Check failed to send")
-
-					#retry connection
-					router = self._weakRefRouter()
-					router.close()
-					router._doRetry()
+			try:
+				self.received_message(m)
 
-		self._lineCheckThread = None
+			except Exception:
+				self._logger.error('Error processing box router message', exc_info= True)
 
-	def terminate(self):
-		#This is code to fix an apparent error in ws4py
-		try:
-			self._th = None #If this is not freed, the socket can't be freed because of circular references
-			super(AstroprintBoxRouterClient, self).terminate()
-
-		except AttributeError as e:
-			if self.stream is None:
-				self.environ = None
-			else:
-				raise e
-
-	def opened(self):
-		self.outstandingPings = 0
-		self._lineCheckThread = threading.Thread(target=self.lineCheck)
-		self._lineCheckThread.daemon = True
-		self._error = False
-		self._lineCheckThread.start()
+		self.closed()
 
-	def closed(self, code, reason=None):
-		#only retry if the connection was terminated by the remote or a link check failure (silentReconnect)
+	def closed(self):
+		#only retry if the connection was not terminated by us
 		router = self._weakRefRouter()
 
-		if self._error or (self.server_terminated and router and router.connected):
+		if router and not self.terminated and (self._error or router.connected):
 			router.close()
 			router._doRetry()
 
+		self.terminated = True
+		self._conn = None
+
 	def received_message(self, m):
-		self._lastReceived = time()
-		msg = json.loads(str(m))
+		msg = json.loads(m)
 		method  = getattr(self._messageHandler, msg['type'], None)
 		if method:
 			response = method(msg)
@@ -189,7 +171,11 @@ class AstroprintBoxRouter(object):
 		self._settings = self.plugin.get_settings()
 		self._logger = self.plugin.get_logger()
 		self._address = self._settings.get(["webSocket"])
+		self._eventLoop = EventLoop(plugin, "Box Router")
+		self._eventLoop.start()
 
+	def get_event_loop(self):
+		return self._eventLoop
 
 	def shutdown(self):
 		self._logger.info('Shutting down Box router...')
@@ -200,13 +186,15 @@ class AstroprintBoxRouter(object):
 
 		self._pendingClientRequests = None
 		self.boxrouter_disconnect()
+		self._eventLoop.stop()
 
 		#make sure we destroy the singleton
 		global _instance
 		_instance = None
 
 	def boxrouter_connect(self):
-		if not self.connected:
+		# The connection is made by the event loop, a failure to connect is retried from there
+		if not self.connected and self.status != self.STATUS_CONNECTING:
 			if self.plugin.user:
 				self._logger.info("Connecting to Box Router as [%s - %s]" % (self._settings.get(["boxName"]), self.plugin.boxId))
 				self._publicKey = self.plugin.user['id']
@@ -217,39 +205,48 @@ class AstroprintBoxRouter(object):
 					self.status = self.STATUS_CONNECTING
 					self.plugin.send_event("boxrouterStatus", self.STATUS_CONNECTING)
 
-					try:
-						if self._retryTimer:
-							#This is in case the user tried to connect and there was a pending retry
-							self._retryTimer.cancel()
-							self._retryTimer = None
-							#If it fails, the retry sequence should restart
-							self._retries = 0
+					if self._retryTimer:
+						#This is in case the user tried to connect and there was a pending retry
+						self._retryTimer.cancel()
+						self._retryTimer = None
+						#If it fails, the retry sequence should restart
+						self._retries = 0
 
-						if self.ws and not self.ws.terminated:
-							self.ws.terminate()
+					if self.ws and not self.ws.terminated:
+						self.ws.terminate()
 
-						self.ws = AstroprintBoxRouterClient(self._address, self, self.plugin)
-						self.ws.connect()
-						self.connected = True
-						if not self._printerListener:
-							self._printerListener = self.plugin.get_printer_listener()
-						self._printerListener.addWatcher(self)
+					self.ws = AstroprintBoxRouterClient(self._address, self, self.plugin, self._eventLoop)
+					self._eventLoop.submit(self._connect(self.ws))
 
-					except Exception as e:
-						self._logger.error("Error connecting to boxrouter: %s" % e)
-						self.connected = False
-						self.status = self.STATUS_ERROR
-						self.plugin.send_event("boxrouterStatus", self.STATUS_ERROR)
+				return True
 
-						if self.ws:
-							self.ws.terminate()
-							self.ws = None
+		return False
 
-						self._doRetry(False) #This one should not be silent
+	async def _connect(self, ws):
+		try:
+			await ws.connect()
+			if ws is not self.ws:
+				#Another connection was started meanwhile
+				ws.terminate()
+				return
+
+			self.connected = True
+			if not self._printerListener:
+				self._printerListener = self.plugin.get_printer_listener()
+			self._printerListener.addWatcher(self)
+
+		except Exception as e:
+			self._logger.error("Error connecting to boxrouter: %s" % e)
+			ws.terminate()
+			if ws is not self.ws:
+				return
 
-					return True
+			self.connected = False
+			self.status = self.STATUS_ERROR
+			self.plugin.send_event("boxrouterStatus", self.STATUS_ERROR)
+			self.ws = None
 
-		return False
+			self._doRetry(False) #This one should not be silent
 
 	def boxrouter_disconnect(self):
 		self.close()
@@ -273,6 +270,13 @@ class AstroprintBoxRouter(object):
 
 				self.ws = None
 
+		elif self.ws and self.status == self.STATUS_CONNECTING:
+			#Still connecting
+			self.ws.terminate()
+			self.ws = None
+			self.status = self.STATUS_DISCONNECTED
+			self.plugin.send_event("boxrouterStatus", self.STATUS_DISCONNECTED)
+
 	def _doRetry(self, silent=True):
 		if self._retries < len(self.RETRY_SCHEDULE):
 			def retry():
@@ -280,11 +284,12 @@ class AstroprintBoxRouter(object):
 				self._logger.info('Retrying boxrouter connection. Retry #%d' % self._retries)
 				self._silentReconnect = silent
 				self._retryTimer = None
-				self.boxrouter_connect()
+				#Getting the token can refresh it with the API, that's kept out of the loop's thread
+				self._eventLoop.execute(self.boxrouter_connect)
 
 			if not self._retryTimer:
 				self._logger.info('Waiting %d secs before retrying...' % self.RETRY_SCHEDULE[self._retries])
-				self._retryTimer = threading.Timer(self.RETRY_SCHEDULE[self._retries] , retry )
+				self._retryTimer = self._eventLoop.timer(self.RETRY_SCHEDULE[self._retries] , retry )
 				self._retryTimer.start()
 
 		else:
@@ -419,23 +424,30 @@ class AstroprintBoxRouter(object):
 			return None
 
 		else:
-			boxName = self._settings.get(["boxName"])
-			platform = sys.platform
-			localIpAddress = octoprint.util.address_for_client("google.com", 80)
-			mayor, minor, build = self.plugin.get_plugin_version().split(".")
-			return {
-			 	'type': 'auth',
-			 	'data': {
-			 		'silentReconnect': self._silentReconnect,
-			 		'boxId': self.plugin.boxId,
-			 		'variantId': self._settings.get(["product_variant_id"]),
-			 		'boxName': boxName,
-			 		'swVersion': "OctoPrint Plugin - v%s.%s(%s)" % (mayor, minor, build),
-			 		'platform': platform,
-			 		'localIpAddress': localIpAddress,
-					'accessToken' : self.plugin.astroprintCloud.getToken(),
-			 		#'publicKey': self._publicKey,
-			 		#'privateKey': self._privateKey,
-					'printerModel': self._settings.get(["printerModel"]) if self._settings.get(['printerModel'])['id'] else None
-			 	}
-			}
+			#The local address and the token take network calls, the auth message is sent from the loop's executor
+			if self.ws:
+				self._eventLoop.execute(self._authenticate, self.ws)
+
+			return None
+
+	def _authenticate(self, ws):
+		boxName = self._settings.get(["boxName"])
+		platform = sys.platform
+		localIpAddress = octoprint.util.address_for_client("google.com", 80)
+		mayor, minor, build = self.plugin.get_plugin_version().split(".")
+		ws.send(json.dumps({
+		 	'type': 'auth',
+		 	'data': {
+		 		'silentReconnect': self._silentReconnect,
+		 		'boxId': self.plugin.boxId,
+		 		'variantId': self._settings.get(["product_variant_id"]),
+		 		'boxName': boxName,
+		 		'swVersion': "OctoPrint Plugin - v%s.%s(%s)" % (mayor, minor, build),
+		 		'platform': platform,
+		 		'localIpAddress': localIpAddress,
+				'accessToken' : self.plugin.astroprintCloud.getToken(),
+		 		#'publicKey': self._publicKey,
+		 		#'privateKey': self._privateKey,
+				'printerModel': self._settings.get(["printerModel"]) if self._settings.get(['printerModel'])['id'] else None
+		 	}
+		}))
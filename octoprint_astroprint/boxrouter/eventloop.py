@@ -0,0 +1,119 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+import asyncio
+import threading
+
+class EventLoop(object):
+	# An asyncio event loop running on a thread of its own. Everything of the box router connection (connecting,
+	# reading and dispatching messages, pings, retries) runs on it, so it takes one thread instead of one per
+	# connection, line check and timer. Other threads get their work done in it with call, timer and submit. Blocking
+	# work (network, camera) is never done in the loop's thread, it's left to its executor with execute.
+
+	def __init__(self, plugin, name):
+		self._plugin = plugin
+		self._name = name
+		self._loop = asyncio.new_event_loop()
+		self._thread = None
+
+	def start(self):
+		self._thread = threading.Thread(target=self._run, name=self._name)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def stop(self):
+		if self._thread:
+			self.submit(self._shutdown())
+			if threading.current_thread() is not self._thread:
+				self._thread.join(5)
+
+			self._thread = None
+
+	def inLoopThread(self):
+		return threading.current_thread() is self._thread
+
+	def call(self, callback, *args):
+		# Runs callback(*args) in the loop's thread, right away when already there
+		if self.inLoopThread():
+			callback(*args)
+		else:
+			self._loop.call_soon_threadsafe(callback, *args)
+
+	def timer(self, delay, callback, args=None):
+		# A LoopTimer, started and cancelled as a threading.Timer but run by the loop
+		return LoopTimer(self, delay, callback, args)
+
+	def submit(self, coroutine):
+		# Runs the coroutine in the loop, returns a concurrent.futures.Future of its result
+		return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+	def execute(self, callback, *args):
+		# Runs callback(*args) in a thread of the loop's executor, returns a concurrent.futures.Future of its result.
+		# Errors are logged, nobody may be waiting for the result.
+		return self.submit(self._execute(callback, args))
+
+	async def _execute(self, callback, args):
+		try:
+			return await self._loop.run_in_executor(None, callback, *args)
+
+		except Exception:
+			self._plugin.get_logger().error("Error running %s" % getattr(callback, "__name__", callback), exc_info= True)
+
+	def _run(self):
+		self._plugin.get_resource_policy().applyToCurrentThread(self._name)
+		asyncio.set_event_loop(self._loop)
+		try:
+			self._loop.run_forever()
+			if hasattr(self._loop, "shutdown_default_executor"): #Python 3.9+
+				self._loop.run_until_complete(self._loop.shutdown_default_executor())
+
+		finally:
+			self._loop.close()
+
+	async def _shutdown(self):
+		#What's still running, like the pings of a connection being closed, is cancelled first
+		tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+		for task in tasks:
+			task.cancel()
+
+		await asyncio.gather(*tasks, return_exceptions=True)
+		self._loop.stop()
+
+	def _schedule(self, delay, callback):
+		#Called in the loop's thread
+		return self._loop.call_later(delay, callback)
+
+class LoopTimer(object):
+
+	def __init__(self, eventLoop, delay, callback, args=None):
+		self._eventLoop = eventLoop
+		self._delay = delay
+		self._callback = callback
+		self._args = args or []
+		self._handle = None
+		self._cancelled = False
+
+	def start(self):
+		self._eventLoop.call(self._schedule)
+
+	def cancel(self):
+		self._cancelled = True
+		self._eventLoop.call(self._cancel)
+
+	def _schedule(self):
+		if not self._cancelled:
+			self._handle = self._eventLoop._schedule(self._delay, self._fire)
+
+	def _cancel(self):
+		if self._handle:
+			self._handle.cancel()
+			self._handle = None
+
+	def _fire(self):
+		self._handle = None
+		if not self._cancelled:
+			self._callback(*self._args)
@@ -8,6 +8,98 @@ __copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released u
 import json
 
 from copy import deepcopy
+from threading import Lock
+from time import time
+
+class TemperatureThrottle(object):
+	# Holds back the temperature reports that don't need to be sent: when no actual temperature moved more than the
+	# deadband of its sensor since the last one sent, or when it comes sooner than the max rate allows. The last report
+	# held back by the rate is sent when the rate allows it, so the last value always gets there. Changes of the
+	# targets (or the sensors) are sent right away. Deadbands and rate come from the plugin's settings snapshot. The
+	# held back report is sent by a timer of the box router's event loop.
+
+	def __init__(self, plugin, send, eventLoop):
+		self._plugin = plugin
+		self._send = send
+		self._eventLoop = eventLoop
+		self._lock = Lock()
+		self._lastSent = None
+		self._lastSentTime = 0.0
+		self._pending = None
+		self._timer = None
+
+	def update(self, payload):
+		snapshot = self._plugin.settingsSnapshot
+
+		with self._lock:
+			if self._targetsChanged(payload):
+				self._sendNow(payload)
+				return
+
+			if self._pending is None and self._withinDeadband(payload, snapshot.temperatureDeadbands):
+				return
+
+			wait = self._lastSentTime + snapshot.temperatureInterval - time()
+			if wait <= 0:
+				self._sendNow(payload)
+
+			else:
+				#Sent at the end of the interval, unless a newer report replaces it first
+				self._pending = payload
+				if not self._timer:
+					self._timer = self._eventLoop.timer(wait, self._flushPending)
+					self._timer.start()
+
+	def flush(self):
+		# Sends the report held back if there's one, returns whether there was
+		with self._lock:
+			if self._pending is not None:
+				self._sendNow(self._pending)
+				return True
+
+		return False
+
+	def _flushPending(self):
+		with self._lock:
+			self._timer = None
+			if self._pending is not None:
+				self._sendNow(self._pending)
+
+	def _sendNow(self, payload):
+		#Called with the lock held
+		if self._timer:
+			self._timer.cancel()
+			self._timer = None
+
+		self._pending = None
+		if self._send(payload):
+			self._lastSent = payload
+			self._lastSentTime = time()
+
+	def _targetsChanged(self, payload):
+		lastSent = self._lastSent
+		if lastSent is None or len(lastSent) != len(payload):
+			return True
+
+		for sensor, temps in payload.items():
+			if sensor not in lastSent or lastSent[sensor]['target'] != temps['target']:
+				return True
+
+		return False
+
+	def _withinDeadband(self, payload, deadbands):
+		lastSent = self._lastSent
+		for sensor, temps in payload.items():
+			actual = temps['actual']
+			lastActual = lastSent[sensor]['actual']
+			if actual is None or lastActual is None:
+				if actual != lastActual:
+					return False
+
+			elif abs(actual - lastActual) > deadbands.get(sensor, 0.0):
+				return False
+
+		return True
 
 class EventSender(object):
 	def __init__(self, socket):
@@ -23,6 +115,7 @@ class EventSender(object):
 			'print_file_download': None,
 			'filament_update' : None,
 		}
+		self._temperatureThrottle = TemperatureThrottle(self._socket.plugin, self._sendTemperature, self._socket.get_event_loop())
 
 
 	def onCaptureInfoChanged(self, payload):
@@ -71,13 +164,26 @@ class EventSender(object):
 
 
 	def sendLastUpdate(self, event):
+		if event == 'temp_update' and self._temperatureThrottle.flush():
+			return
+
 		if event in self._lastSent:
 			self._send(event, self._lastSent[event])
 
 	def sendUpdate(self, event, data):
-		if self._lastSent[event] != data and self._send(event, data):
+		if event == 'temp_update':
+			self._temperatureThrottle.update(data)
+
+		elif self._lastSent[event] != data and self._send(event, data):
 			self._lastSent[event] = deepcopy(data) if data else None
 
+	def _sendTemperature(self, data):
+		if self._send('temp_update', data):
+			self._lastSent['temp_update'] = deepcopy(data)
+			return True
+
+		return False
+
 	def _send(self, event, data):
 			try:
 				self._socket.sendEvent(event, data)
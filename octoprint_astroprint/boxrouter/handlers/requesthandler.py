@@ -6,7 +6,6 @@ __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agp
 __copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
 
 import base64
-import threading
 import re
 
 from time import sleep
@@ -26,19 +25,8 @@ class RequestHandler(object):
 	def initial_state(self, data, clientId, done):
 		if not self.astroprintCloud:
 			self.astroprintCloud = self.plugin.astroprintCloud
-		dataProfile = self.wsClient.plugin._printer_profile_manager.get_current_or_default()
-
-		profile = {
-			'driver': "marlin", #At the moment octopi only supports marlin
-			'extruder_count': dataProfile['extruder']['count'],
-			'max_nozzle_temp': self._settings.get(["max_nozzle_temp"]),
-			'max_bed_temp': self._settings.get(["max_bed_temp"]),
-			'heated_bed': dataProfile['heatedBed'],
-			'cancel_gcode': ['G28 X0 Y0'],
-			'invert_z': dataProfile['axes']['z']['inverted'],
-			'printer_model': self._settings.get(["printerModel"]) if self._settings.get(['printerModel'])['id']  else None,
-			'filament' : self._settings.get(["filament"])
-		}
+		snapshot = self.plugin.settingsSnapshot
+		profile = snapshot.profile('printer_model')
 
 		state = {
 			'printing': self._printer.is_printing() or self._printer.is_paused(),
@@ -47,7 +35,7 @@ class RequestHandler(object):
 			'ready_to_print': self.plugin.isBedClear and self._printer.is_operational() and not (self._printer.is_printing() or self._printer.is_paused()),
 			'paused': self._printer.is_paused(),
 			'camera': True, #self.cameraManager.cameraActive,
-			'filament' : self._settings.get(["filament"]),
+			'filament' : snapshot.filament,
 			'printCapture': self.cameraManager.timelapseInfo,
 			'profile': profile,
 			'capabilities': self.plugin.capabilities,
@@ -81,8 +69,8 @@ class RequestHandler(object):
 
 	def job_info(self, data, clientId, done):
 		if self._printerListener.get_job_data() and not self._printerListener.get_job_data()['layerCount']:
-			t = threading.Timer(0.5, self.job_info, [data, clientId, done])
-			t.start()
+			#Asked again when the layer count is there, by the box router's event loop
+			self.wsClient.callLater(0.5, self.job_info, [data, clientId, done])
 		else:
 			done(self._printerListener.get_job_data())
 
@@ -91,6 +79,9 @@ class RequestHandler(object):
 
 
 	def printCapture(self, data, clientId, done):
+		self._execute(self._printCapture, data, done)
+
+	def _printCapture(self, data, done):
 		freq = data['freq']
 		if freq:
 			cm = self.cameraManager
@@ -122,15 +113,21 @@ class RequestHandler(object):
 
 	def signoff(self, data, clientId, done):
 		self._logger.info('Remote signoff requested.')
-		threading.Timer(1, self.astroprintCloud.unauthorizedHandler, [False]).start()
+		self.wsClient.callLater(1, self.wsClient.execute, [self.astroprintCloud.unauthorizedHandler, False])
 		done(None)
 
 	def notifyfleet(self, data, clientId, done):
 		self._logger.info("Box has been joined to a fleet group")
+		self._execute(self._notifyfleet, data, done)
+
+	def _notifyfleet(self, data, done):
 		self.astroprintCloud.getFleetInfo()
 		done(None)
 
 	def print_file(self, data, clientId, done):
+		self._execute(self._print_file, data, done)
+
+	def _print_file(self, data, done):
 		print_file_id = data['printFileId']
 
 		if 'printJobId' in data and data['printJobId']:
@@ -157,13 +154,18 @@ class RequestHandler(object):
 			done(state)
 
 	def cancel_download(self, data, clientId, done):
+		self._execute(self._cancel_download, data, done)
+
+	def _cancel_download(self, data, done):
 		print_file_id = data['printFileId']
 		self.astroprintCloud.cancelDownload(print_file_id)
 
 		done(None)
 
 	def set_filament(self, data, clientId, done):
+		self._execute(self._set_filament, data, done)
 
+	def _set_filament(self, data, done):
 		filament = {}
 
 		if data['filament'] and data['filament']['name'] and data['filament']['color']:
@@ -171,8 +173,7 @@ class RequestHandler(object):
 			#Better to make sure that are getting right color codes
 			if re.search(r'^#(?:[0-9a-fA-F]{3}){1,2}$', data['filament']['color']):
 				filament['color'] = data['filament']['color']
-				self._settings.set(['filament'], filament)
-				self._settings.save()
+				self.plugin.saveSetting(['filament'], filament)
 				self.astroprintCloud.bm.triggerEvent('filamentChanged', data)
 				done(None)
 			else:
@@ -183,14 +184,35 @@ class RequestHandler(object):
 
 		else:
 			data['filament'] = None
-			self._settings.set(['filament'], None)
-			self._settings.save()
+			self.plugin.saveSetting(['filament'], None)
 			self.astroprintCloud.bm.triggerEvent('filamentChanged', data)
 			done(None)
 
+	def _execute(self, method, data, done):
+		# Requests going to the AstroPrint API, the camera or the disk are handled out of the box router's loop, by
+		# its executor, so they don't hold up the connection. done can be called from any thread.
+		answered = []
+
+		def answer(result):
+			answered.append(True)
+			done(result)
+
+		def handle():
+			try:
+				method(data, answer)
+
+			except Exception as e:
+				message = 'Error handling [%s] request: %s' % (method.__name__.lstrip('_'), e)
+				self._logger.error(message, exc_info= True)
+				#Some answer before they are done, like print_file
+				if not answered:
+					done({'error': True, 'message': message})
+
+		self.wsClient.execute(handle)
+
 	#set CommandGroup for future camera and 2p2 updates
 	def _handleCommandGroup(self, handlerClass, data, clientId, done, plugin = None):
-		handler = handlerClass(plugin)
+		handler = handlerClass(plugin, self.wsClient)
 
 		command = data['command']
 		options = data['options']
@@ -209,8 +231,9 @@ class RequestHandler(object):
 # Printer Command Group Handler
 class PrinterCommandHandler(object):
 
-	def __init__(self, plugin):
+	def __init__(self, plugin, wsClient):
 		self.plugin = plugin
+		self.wsClient = wsClient
 		self._printer = self.plugin.get_printer()
 		self._settings = self.plugin.get_settings()
 		self._logger = self.plugin.get_logger()
@@ -230,6 +253,10 @@ class PrinterCommandHandler(object):
 		done(None)
 
 	def photo(self, data, clientId, done):
+		#Taking the picture blocks, it's done out of the box router's loop
+		self.wsClient.execute(self._takePhoto, done)
+
+	def _takePhoto(self, done):
 		pic = self.cameraManager.getPic()
 
 		if pic is not None:
@@ -69,8 +69,12 @@ class CameraManager(object):
 		self.timelapseInfo = None
 		self.plugin.get_printer_listener().cameraManager = self
 
-	def layerChanged(self):
+	def layerChanged(self, layers=1):
+		# layers is the number of layer changes since the last call, more than one when they came while the last photo
+		# was taken. Only the current one can be photographed.
 		if self.timelapseInfo and self.timelapseInfo['freq'] == "layer":
+			if layers > 1:
+				self._logger.info("%d layers printed while taking the last print capture photo" % (layers - 1))
 			self.addPhotoToTimelapse(self.timelapseInfo['id'])
 
 	def checkCameraStatus(self):
@@ -337,6 +341,7 @@ class TimelapseWorker(threading.Thread):
 		self._logger = manager._logger
 
 	def run(self):
+		self._cm.plugin.get_resource_policy().applyToCurrentThread("Timelapse Worker")
 		lastUpload = 0
 		self._resumeFromPause.set()
 		while not self._stopExecution:
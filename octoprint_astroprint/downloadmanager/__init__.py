@@ -35,6 +35,7 @@ class DownloadWorker(threading.Thread):
 		super(DownloadWorker, self).__init__()
 
 	def run(self):
+		self.plugin.get_resource_policy().applyToCurrentThread("Download Worker")
 		downloadQueue = self._manager.queue
 
 		while True:
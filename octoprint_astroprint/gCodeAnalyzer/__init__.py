@@ -6,25 +6,52 @@ __license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agp
 __copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
 
 import json
+import os
+import sys
+import heapq
+import itertools
+import subprocess
 
-from threading import Thread
-from sarge import run, Capture
+from threading import Thread, Condition, Lock
+from octoprint.filemanager.destinations import FileDestinations
+from octoprint_astroprint.resourcepolicy import killProcess
+from octoprint_astroprint.gCodeAnalyzer import resultformat
 
-class GCodeAnalyzer(Thread):
+ENGINE_NATIVE = "native"
+ENGINE_PYTHON = "python"
+ENGINE_AUTO = "auto"
 
-	def __init__(self,filename,layersInfo,readyCallback,exceptionCallback,parent, plugin):
+#Analysis priorities, lower runs first
+PRIORITY_PRINT = 0 #File of the current print
+PRIORITY_AHEAD = 1 #File just added to the library
+PRIORITY_BACKFILL = 2 #Older library files, only analyzed while the printer is idle
 
-		self._logger = plugin.get_logger()
+#With more than one CPU, the auto engine analyzes files this big with the python engine, it splits them across CPUs
+PARALLEL_FILE_SIZE = 500 * 1024 * 1024
+
+#Print times of analyses not planning the moves (native engine, no NumPy) fall short of the real ones by about this
+UNPLANNED_TIME_FACTOR = 1.07
+
+#The python engine publishes a partial result every this many MB, they are delivered to the print waiting for the file
+PARTIAL_RESULTS_MB = 8
 
-		super(GCodeAnalyzer, self).__init__()
+class GCodeAnalyzer(object):
+	#Whether the native analyzer can be executed on this host, probed the first time the auto engine needs it
+	_nativeAvailable = None
+
+	def __init__(self,filename,layersInfo,readyCallback,exceptionCallback,parent, plugin, priority=PRIORITY_PRINT, partialCallback=None):
+
+		self._logger = plugin.get_logger()
 
 		self.plugin = plugin
 		self.filename = filename
 
 		self.readyCallback = readyCallback
 		self.exceptionCallback = exceptionCallback
+		self.partialCallback = partialCallback
 		self.layersInfo = layersInfo
-		self.daemon = True
+		self.priority = priority
+		self.cancelled = False
 
 		self.layerList = None
 		self.totalPrintTime = None
@@ -32,70 +59,388 @@ class GCodeAnalyzer(Thread):
 		self.size = None
 		self.layerHeight = None
 		self.totalFilament = None
+		self.filamentTimeline = None
 		self.parent = parent
 
 	def makeCalcs(self):
-		self.start()
+		cache = self.plugin.get_analysis_cache()
+		gcodeData = cache.get(self.filename, self.layersInfo) if cache else None
 
-	def run(self):
-		gcodeData = []
-		try:
-			pipe = run(
-				('%s/util/AstroprintGCodeAnalyzer "%s" 1' if self.layersInfo else '%s/util/AstroprintGCodeAnalyzer "%s"') % (
-					self.plugin._basefolder,
-					self.filename
-				), stdout=Capture())
+		if gcodeData:
+			self.gcodeDataReady(gcodeData)
+		else:
+			self.plugin.get_analyzer_service().submit(self)
 
-			if pipe.returncode == 0:
-				try:
-					gcodeData = json.loads(pipe.stdout.text)
+	def cancel(self):
+		service = self.plugin.get_analyzer_service()
+		if service:
+			service.cancel(self)
 
-					if self.layersInfo:
-						self.layerList =  gcodeData['layers']
+	def gcodeDataReady(self, gcodeData):
+		if self.layersInfo:
+			self.layerList =  gcodeData['layers']
 
-					self.totalPrintTime = gcodeData['print_time']
+		self.totalPrintTime = gcodeData['print_time'] if gcodeData.get('planned') else gcodeData['print_time'] * UNPLANNED_TIME_FACTOR
 
-					self.layerCount = gcodeData['layer_count']
+		self.layerCount = gcodeData['layer_count']
 
-					self.size = gcodeData['size']
+		self.size = gcodeData['size']
 
-					self.layerHeight = gcodeData['layer_height']
+		self.layerHeight = gcodeData['layer_height']
 
-					self.totalFilament = None#total_filament has not got any information
+		self.totalFilament = None#total_filament has not got any information
 
-					self.readyCallback(self.layerList,self.totalPrintTime,self.layerCount,self.size,self.layerHeight,self.totalFilament,self.parent)
+		self.filamentTimeline = gcodeData.get('filament_timeline')
 
+		self.readyCallback(self.layerList,self.totalPrintTime,self.layerCount,self.size,self.layerHeight,self.totalFilament,self.parent)
 
-				except ValueError:
-					self._logger.error("Bad gcode data returned: %s" % pipe.stdout.text)
-					gcodeData = None
+	def partialDataReady(self, gcodeData):
+		# Result for the part of the file analyzed so far, its print time is extrapolated to the whole file. Called with
+		# the same arguments as readyCallback, the layer count being the layers found so far.
+		if self.partialCallback:
+			totalPrintTime = gcodeData['print_time'] if gcodeData.get('planned') else gcodeData['print_time'] * UNPLANNED_TIME_FACTOR
+			self.partialCallback(gcodeData.get('layers'),totalPrintTime,gcodeData['layer_count'],gcodeData['size'],gcodeData['layer_height'],None,self.parent)
 
-					if self.exceptionCallback:
-						parameters = {}
-						parameters['parent'] = self.parent
-						parameters['filename'] = self.filename
+	def analysisFailed(self):
+		if self.exceptionCallback:
+			parameters = {}
+			parameters['parent'] = self.parent
+			parameters['filename'] = self.filename
 
-						self.exceptionCallback(parameters)
+			self.exceptionCallback(parameters)
 
-			else:
-				self._logger.warn('Error executing GCode Analyzer')
-				gcodeData = None
+	@property
+	def autoEngine(self):
+		return self.plugin.get_settings().get(["analyzer_engine"]) not in (ENGINE_NATIVE, ENGINE_PYTHON)
+
+	@property
+	def engine(self):
+		engine = self.plugin.get_settings().get(["analyzer_engine"])
+		if self.autoEngine:
+			if self.jobs > 1 and os.path.getsize(self.filename) >= PARALLEL_FILE_SIZE:
+				return ENGINE_PYTHON
+
+			return ENGINE_NATIVE if self.nativeAvailable() else ENGINE_PYTHON
+
+		return engine
+
+	@property
+	def jobs(self):
+		# Processes used by the python engine, 0 in the settings means all the CPUs the resource policy allows
+		jobs = self.plugin.get_settings().get_int(["analyzer_jobs"])
+		if not jobs:
+			cpus = self.plugin.get_resource_policy().cpuAffinity
+			jobs = len(cpus) if cpus else (len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count())
+
+		return jobs
+
+	def nativeAnalyzerPath(self):
+		return os.path.join(self.plugin._basefolder, "util", "AstroprintGCodeAnalyzer")
+
+	def nativeAvailable(self):
+		# Run directly, not under the resource policy, ionice hands binaries it can't exec to the shell and the exit code
+		# doesn't tell anymore
+		if GCodeAnalyzer._nativeAvailable is None:
+			try:
+				with open(os.devnull, "w") as devnull:
+					subprocess.call([self.nativeAnalyzerPath()], stdout=devnull, stderr=devnull, close_fds=True)
+				GCodeAnalyzer._nativeAvailable = True
+
+			except OSError:
+				self._logger.warn('Native GCode Analyzer can\'t run on this host, using the python engine')
+				GCodeAnalyzer._nativeAvailable = False
+
+		return GCodeAnalyzer._nativeAvailable
+
+	def analyzerCommand(self, engine, layersInfo, partial=False):
+		if engine == ENGINE_PYTHON:
+			command = [
+				sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "engine.py"),
+				"--jobs=%d" % self.jobs, "--limits=%s" % json.dumps(self.plugin.get_motion_limits().toDict()), "--format=binary"
+			]
+			if partial:
+				command.append("--partial=%d" % PARTIAL_RESULTS_MB)
+
+			command.append(self.filename)
+		else:
+			command = [self.nativeAnalyzerPath(), self.filename]
 
+		return command + ["1"] if layersInfo else command
 
-				if self.exceptionCallback:
-					parameters = {}
-					parameters['parent'] = self.parent
-					parameters['filename'] = self.filename
+	def runAnalyzer(self, job, engine, onOutput, partial=False):
+		# The analyzer runs without a shell, under the resource policy, and is registered in the job so it can be
+		# killed when cancelled
+		def onStart(process):
+			if not job.attachProcess(process):
+				killProcess(process)
 
-					self.exceptionCallback(parameters)
+		returncode, gcodeData = self.plugin.get_resource_policy().runProcess("GCode Analyzer", self.analyzerCommand(engine, job.layersInfo, partial), onStart, onOutput)
+		job.attachProcess(None)
+		return returncode, gcodeData
 
-		except:
+	def analyze(self, job, onPartial=None):
+		#Runs in the analyzer service thread, returns the analyzer data or None. onPartial is called with the partial
+		#results while the analyzer runs.
+		def readOutput(stream):
+			#Binary from the python engine, partial results first, JSON from the native one
+			gcodeData = None
+			try:
+				for result in resultformat.readResults(stream):
+					if not result.get('partial'):
+						gcodeData = result
+					elif onPartial and not job.cancelled:
+						onPartial(result)
+
+			except ValueError as e:
+				if not job.cancelled:
+					self._logger.error("Bad gcode data returned: %s" % e)
+
+				stream.read()
+				return None
+
+			return gcodeData
+
+		engine = self.engine
+		gcodeData = self.runEngine(job, engine, readOutput, onPartial is not None)
+
+		if gcodeData is None and engine == ENGINE_NATIVE and self.autoEngine and not job.cancelled:
+			#The native analyzer runs but fails on this host or file, the python engine can still do it
+			self._logger.warn('Native GCode Analyzer failed, analyzing %s with the python engine' % self.filename)
+			gcodeData = self.runEngine(job, ENGINE_PYTHON, readOutput, onPartial is not None)
+
+		return gcodeData
+
+	def runEngine(self, job, engine, readOutput, partial):
+		returncode, gcodeData = self.runAnalyzer(job, engine, readOutput, partial)
+
+		if job.cancelled:
+			return None
+
+		if returncode is None:
 			self._logger.warn('Error running GCode Analyzer')
+			return None
+
+		if returncode != 0:
+			self._logger.warn('Error executing GCode Analyzer')
+			return None
+
+		return gcodeData
+
+
+class AnalyzerJob(object):
+	# Analysis of one file. Every GCodeAnalyzer asking for the same file while it's queued or running subscribes to the
+	# same job so the file is only analyzed once.
+
+	def __init__(self, analyzer, sequence):
+		self.filename = analyzer.filename
+		self.priority = analyzer.priority
+		self.sequence = sequence
+		self.subscribers = [analyzer]
+		self.cancelled = False
+		self.running = False
+		self._process = None
+		self._processLock = Lock()
+
+	@property
+	def layersInfo(self):
+		return any(a.layersInfo for a in self.subscribers)
+
+	def attachProcess(self, process):
+		with self._processLock:
+			if self.cancelled and process:
+				return False
+
+			self._process = process
+			return True
+
+	def cancel(self):
+		with self._processLock:
+			self.cancelled = True
+			if self._process:
+				killProcess(self._process)
+
+class AnalyzerService(Thread):
+	# Long lived worker running the GCode analysis one file at a time, by priority. The file of the current print goes
+	# first, duplicated requests are merged and cancelled jobs are dropped or their analyzer process killed.
+	IDLE_CHECK_INTERVAL = 10
+
+	def __init__(self, plugin):
+		super(AnalyzerService, self).__init__()
+
+		self.daemon = True
+		self.plugin = plugin
+		self._logger = plugin.get_logger()
+		self._printer = plugin.get_printer()
+		self._condition = Condition()
+		self._queue = []
+		self._jobs = {}
+		self._sequence = itertools.count()
+		self._pushes = itertools.count()
+		self._shutdown = False
+
+	def _push(self, job):
+		heapq.heappush(self._queue, (job.priority, job.sequence, next(self._pushes), job))
+
+	def submit(self, analyzer):
+		with self._condition:
+			job = self._jobs.get(analyzer.filename)
+
+			if job and not job.cancelled:
+				job.subscribers.append(analyzer)
+				if analyzer.priority < job.priority:
+					job.priority = analyzer.priority
+					if not job.running:
+						self._push(job)
+
+			else:
+				job = AnalyzerJob(analyzer, next(self._sequence))
+				self._jobs[job.filename] = job
+				self._push(job)
+
+			self._condition.notify()
+
+	def cancel(self, analyzer):
+		with self._condition:
+			#Results delivered from now on are not for it, even the ones of a job already done
+			analyzer.cancelled = True
+			job = self._jobs.get(analyzer.filename)
+
+			if job and analyzer in job.subscribers:
+				job.subscribers.remove(analyzer)
+
+				if not job.subscribers:
+					self._logger.info("Cancelling analysis of %s" % job.filename)
+					job.cancel()
+					del self._jobs[job.filename]
+
+				else:
+					priority = min(a.priority for a in job.subscribers)
+					if priority != job.priority:
+						job.priority = priority
+						if not job.running:
+							self._push(job)
+
+	def analyzeAhead(self, filename, backfill=False):
+		cache = self.plugin.get_analysis_cache()
+		if not cache or not cache.has(filename):
+			self.submit(GCodeAnalyzer(filename, True, lambda *args: None, None, self, self.plugin, PRIORITY_BACKFILL if backfill else PRIORITY_AHEAD))
+
+	def backfill(self, maxFiles):
+		fileManager = self.plugin.get_file_manager()
+		files = []
+
+		def addFiles(entries):
+			for entry in entries.values():
+				if entry.get('type') == 'folder':
+					addFiles(entry.get('children', {}))
+				elif entry.get('type') == 'machinecode':
+					files.append(entry)
+
+		try:
+			addFiles(fileManager.list_files(FileDestinations.LOCAL, recursive=True).get(FileDestinations.LOCAL, {}))
+
+		except Exception:
+			self._logger.error("Unable to list local files for analysis", exc_info= True)
+			return
+
+		#Most recent files first, no more than the cache can hold
+		files.sort(key=lambda entry: entry.get('date') or 0, reverse=True)
+		for entry in files[:maxFiles]:
+			self.analyzeAhead(fileManager.path_on_disk(FileDestinations.LOCAL, entry['path']), True)
+
+	def isIdle(self):
+		return not (self._printer.is_printing() or self._printer.is_paused())
+
+	def _nextJob(self):
+		with self._condition:
+			while not self._shutdown:
+				#Drop cancelled jobs and entries left behind by a priority change
+				while self._queue and (self._queue[0][3].cancelled or self._queue[0][3].running or self._queue[0][0] != self._queue[0][3].priority):
+					heapq.heappop(self._queue)
+
+				if self._queue:
+					job = self._queue[0][3]
+					if job.priority < PRIORITY_BACKFILL or self.isIdle():
+						heapq.heappop(self._queue)
+						job.running = True
+						return job, job.subscribers[0]
+
+					self._condition.wait(self.IDLE_CHECK_INTERVAL)
+
+				else:
+					self._condition.wait()
+
+			return None, None
+
+	def run(self):
+		self.plugin.get_resource_policy().applyToCurrentThread("GCode Analyzer Service")
+
+		while True:
+			job, analyzer = self._nextJob()
+			if not job:
+				return
+
 			gcodeData = None
+			try:
+				cache = self.plugin.get_analysis_cache()
+				gcodeData = cache.get(job.filename, job.layersInfo) if cache else None
+
+				if not gcodeData and os.path.isfile(job.filename):
+					if job.priority != PRIORITY_PRINT:
+						self._logger.info("Analyzing %s ahead of printing" % job.filename)
+
+					#Always asked for, a print can start with the file while it's analyzed ahead
+					gcodeData = analyzer.analyze(job, self._partialDelivery(job))
+
+					if gcodeData and cache:
+						cache.put(job.filename, gcodeData)
+
+			except Exception:
+				self._logger.error("Error analyzing %s" % job.filename, exc_info= True)
+				gcodeData = None
+
+			with self._condition:
+				if self._jobs.get(job.filename) is job:
+					del self._jobs[job.filename]
+
+				subscribers = [] if job.cancelled else list(job.subscribers)
+
+			for analyzer in subscribers:
+				if analyzer.cancelled:
+					continue
+
+				try:
+					if gcodeData:
+						analyzer.gcodeDataReady(gcodeData)
+					else:
+						analyzer.analysisFailed()
+
+				except Exception:
+					self._logger.error("Error delivering the analysis of %s" % job.filename, exc_info= True)
+
+	def _partialDelivery(self, job):
+		# Partial results go to the subscribers waiting for them (the print) at the time they arrive, including the
+		# ones subscribed after the analysis started
+		def deliver(gcodeData):
+			with self._condition:
+				subscribers = [] if job.cancelled else [analyzer for analyzer in job.subscribers if analyzer.partialCallback]
+
+			for analyzer in subscribers:
+				if analyzer.cancelled:
+					continue
+
+				try:
+					analyzer.partialDataReady(gcodeData)
+
+				except Exception:
+					self._logger.error("Error delivering the partial analysis of %s" % job.filename, exc_info= True)
+
+		return deliver
 
-			if self.exceptionCallback:
-				parameters = {}
-				parameters['parent'] = self.parent
-				parameters['filename'] = self.filename
+	def shutdown(self):
+		with self._condition:
+			self._shutdown = True
+			for job in self._jobs.values():
+				job.cancel()
 
-				self.exceptionCallback(parameters)
+			self._condition.notify()
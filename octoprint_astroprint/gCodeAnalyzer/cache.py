@@ -0,0 +1,99 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+import os
+import hashlib
+
+from threading import Lock
+
+from octoprint_astroprint.gCodeAnalyzer import resultformat
+
+class AnalysisCache(object):
+	# On disk cache of the GCode analyzer results. Every entry is a binary result file (see resultformat) named after
+	# the file path, size and modification time so a modified file never hits an old entry. The motion limits captured
+	# while printing aren't part of the name, so they don't invalidate the entries of the files analyzed ahead. The
+	# modification time of the entry is used as last access time to evict the least recently used ones.
+
+	def __init__(self, plugin, maxEntries=50):
+		self._logger = plugin.get_logger()
+		self._folder = os.path.join(plugin.get_plugin_data_folder(), "analysis_cache")
+		self._maxEntries = maxEntries
+		self._lock = Lock()
+
+		if not os.path.isdir(self._folder):
+			os.makedirs(self._folder)
+
+	def _entryPath(self, filename):
+		try:
+			stat = os.stat(filename)
+
+		except OSError:
+			return None
+
+		key = "%s|%d|%d" % (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+		return os.path.join(self._folder, "%s.bin" % hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+	def has(self, filename):
+		entry = self._entryPath(filename)
+		return entry is not None and os.path.isfile(entry)
+
+	def get(self, filename, layersInfo=True):
+		entry = self._entryPath(filename)
+		if not entry:
+			return None
+
+		with self._lock:
+			try:
+				with open(entry, "rb") as f:
+					gcodeData = resultformat.loads(f.read())
+
+				os.utime(entry, None)
+
+			except IOError:
+				return None
+
+			except ValueError:
+				self._logger.warn("Removing corrupted analysis cache entry %s" % entry)
+				self._remove(entry)
+				return None
+
+		if layersInfo and 'layers' not in gcodeData:
+			return None
+
+		return gcodeData
+
+	def put(self, filename, gcodeData):
+		entry = self._entryPath(filename)
+		if not entry:
+			return
+
+		with self._lock:
+			try:
+				tmpEntry = entry + ".tmp"
+				with open(tmpEntry, "wb") as f:
+					f.write(resultformat.dumps(gcodeData))
+				os.rename(tmpEntry, entry)
+
+			except (IOError, OSError):
+				self._logger.error("Unable to save analysis cache entry for %s" % filename, exc_info= True)
+				return
+
+			self._evict()
+
+	def _evict(self):
+		entries = [os.path.join(self._folder, name) for name in os.listdir(self._folder) if name.endswith(".bin")]
+		if len(entries) > self._maxEntries:
+			entries.sort(key=lambda entry: os.path.getmtime(entry))
+			for entry in entries[:len(entries) - self._maxEntries]:
+				self._remove(entry)
+
+	def _remove(self, entry):
+		try:
+			os.remove(entry)
+
+		except OSError:
+			pass
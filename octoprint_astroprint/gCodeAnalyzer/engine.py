@@ -0,0 +1,748 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Pure python replacement for util/AstroprintGCodeAnalyzer.
+#
+# It only depends on the standard library so it can be run as a script in the same way as the native binary:
+#
+#    python engine.py <file> [1]
+#
+# and prints the same JSON document to stdout. Big files are split in chunks scanned by a pool of processes, the
+# number of processes can be given with --jobs=N (all the available CPUs by default).
+#
+# When NumPy is available, print times come from planning the moves with the firmware motion limits (see planner.py).
+# The limits can be given as JSON with --limits=..., the M201/M203/M204/M205 commands in the file override them.
+# Without NumPy, moves are timed at their feedrate and the result isn't marked as planned.
+#
+# With --format=binary the result is written in the format of resultformat.py instead of JSON, and with
+# --output=<file> it's written to that file instead of stdout. In binary format, --partial=N also writes a partial
+# result, for the part of the file scanned so far, every N MB before the complete one.
+
+import errno
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import sys
+
+from array import array
+
+try:
+	from . import planner, resultformat
+	from .layers import LayerTable
+	from .limits import MotionLimits
+	from .timeline import FilamentTimeline, TIMELINE_INTERVAL
+except ImportError:
+	#Run as a script
+	import planner
+	import resultformat
+	from layers import LayerTable
+	from limits import MotionLimits
+	from timeline import FilamentTimeline, TIMELINE_INTERVAL
+
+#Two extrusions closer than this in Z are considered to be in the same layer
+LAYER_Z_EPSILON = 0.001
+
+#Exit code when the analysis runs out of memory (see ResourcePolicy)
+EXIT_OUT_OF_MEMORY = 3
+
+#Bytes of the file mapped at once, keeps the address space used by the analysis bounded for very big files
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+#Smaller files are scanned by a single process, it's not worth starting the pool
+PARALLEL_MIN_SIZE = 32 * 1024 * 1024
+
+#The state after the header of the file (start gcode) is the guessed state for chunks not starting at the beginning
+HEADER_SIZE = 1024 * 1024
+
+#Files are scanned a window of this many bytes at a time. The moves of a window are planned together and chunks
+#scanned from a guessed state record their state after every window for the stitching pass.
+WINDOW_SIZE = 256 * 1024
+
+#Event types produced by the scanner
+EVENT_Z_CHANGE = 0
+EVENT_EXTRUSION = 1
+
+class ScanState(object):
+
+	def __init__(self, limits=None):
+		self.x = 0.0
+		self.y = 0.0
+		self.z = 0.0
+		self.e = 0.0
+		self.f = 0.0
+		self.relative = False
+		self.eRelative = False
+		self.tool = 0
+		self.limits = limits #MotionLimits, None when moves aren't planned
+		self.previous = None #direction and speed of the last planned move
+
+	def snapshot(self):
+		return (self.x, self.y, self.z, self.e, self.f, self.relative, self.eRelative, self.tool, self.limits.snapshot() if self.limits else None)
+
+	def restore(self, snapshot):
+		self.x, self.y, self.z, self.e, self.f, self.relative, self.eRelative, self.tool, limits = snapshot
+		self.limits = MotionLimits.fromSnapshot(limits) if limits else None
+		self.previous = None
+
+	@classmethod
+	def fromSnapshot(cls, snapshot):
+		state = cls()
+		state.restore(snapshot)
+		return state
+
+class ScanResult(object):
+
+	def __init__(self):
+		self.events = []
+		self.time = 0.0
+		self.filament = 0.0
+		self.offset = 0 #where the last scan stopped
+		self.toolFilament = {} #net filament extruded by every tool
+		self.timeline = [] #(offset, tool, toolFilament of the tool there) samples
+		self.nextSample = 0 #offset from which the next timeline sample is taken
+		self.resetBounds()
+
+	def bounds(self):
+		return (self.minX, self.minY, self.maxX, self.maxY, self.maxZ)
+
+	def resetBounds(self):
+		self.minX = float("inf")
+		self.minY = float("inf")
+		self.maxX = float("-inf")
+		self.maxY = float("-inf")
+		self.maxZ = float("-inf")
+
+	def addBounds(self, bounds):
+		minX, minY, maxX, maxY, maxZ = bounds
+		self.minX = min(self.minX, minX)
+		self.minY = min(self.minY, minY)
+		self.maxX = max(self.maxX, maxX)
+		self.maxY = max(self.maxY, maxY)
+		self.maxZ = max(self.maxZ, maxZ)
+
+	def append(self, scan, events=None, timeline=None):
+		# Adds the scan of the next part of the file, its event times and tool filament are relative to its beginning
+		delta = self.time
+		self.events.extend((e[0], e[1], e[2] + delta) + e[3:] for e in (scan.events if events is None else events))
+		toolFilament = self.toolFilament
+		self.timeline.extend((s[0], s[1], s[2] + toolFilament.get(s[1], 0.0)) for s in (scan.timeline if timeline is None else timeline))
+		for tool, filament in scan.toolFilament.items():
+			toolFilament[tool] = toolFilament.get(tool, 0.0) + filament
+
+		self.time += scan.time
+		self.filament += scan.filament
+		self.offset = scan.offset
+		self.nextSample = scan.nextSample
+		self.addBounds(scan.bounds())
+
+class Checkpoint(object):
+	# State of a chunk scan at a line boundary: accumulated time, filament, events and timeline samples, and the
+	# bounds of the lines scanned since the previous checkpoint
+
+	def __init__(self, offset, state, result, bounds):
+		self.offset = offset
+		self.state = state
+		self.time = result.time
+		self.filament = result.filament
+		self.toolFilament = dict(result.toolFilament)
+		self.events = len(result.events)
+		self.samples = len(result.timeline)
+		self.bounds = bounds
+
+class ChunkScan(object):
+
+	def __init__(self, start, end, initial, result, checkpoints):
+		self.start = start
+		self.end = end
+		self.initial = initial
+		self.result = result
+		self.checkpoints = checkpoints
+
+def planPending(moves, eventMoves, events, firstEvent, state, time):
+	# Plans the moves buffered by scanRange. Events since firstEvent get the time of the moves before them (given by
+	# eventMoves) added. Returns the time after the moves.
+	if moves:
+		accumulated, state.previous = planner.planMoves(moves, state.limits, state.previous)
+
+		for i, moveCount in enumerate(eventMoves):
+			if moveCount:
+				event = events[firstEvent + i]
+				events[firstEvent + i] = (event[0], event[1], event[2] + float(accumulated[moveCount - 1])) + event[3:]
+
+		time += float(accumulated[-1])
+
+	del moves[:]
+	del eventMoves[:]
+	return time
+
+def scanRange(mm, start, end, state, result=None, base=0):
+	# Scans the lines between the byte offsets start and end of the map (start must be at the beginning of a line),
+	# base is the file offset where the map begins. The movement state is updated in place and the layer relevant
+	# events are appended to the result with the file offset and the time elapsed at the beginning of the line where
+	# they happened. When planning, moves are timed in a batch at the end.
+	if result is None:
+		result = ScanResult()
+
+	limits = state.limits
+	moves = []
+	eventMoves = []
+	firstEvent = len(result.events)
+
+	x = state.x
+	y = state.y
+	z = state.z
+	e = state.e
+	f = state.f
+	relative = state.relative
+	eRelative = state.eRelative
+	tool = state.tool
+
+	toolFilament = result.toolFilament
+	toolE = toolFilament.get(tool, 0.0)
+	timeline = result.timeline
+	nextSample = result.nextSample
+
+	time = result.time
+	filament = result.filament
+	minX = result.minX
+	minY = result.minY
+	maxX = result.maxX
+	maxY = result.maxY
+	maxZ = result.maxZ
+	events = result.events
+	extrudedSinceZ = False
+
+	sqrt = math.sqrt
+	readline = mm.readline
+	mm.seek(start)
+	offset = start
+
+	while offset < end:
+		line = readline()
+		lineStart = base + offset
+		offset += len(line)
+
+		if line[:1] != b"G" and line[:1] != b"M":
+			if line[:1] == b"T":
+				#Tool change, the timeline gets a sample of both tools where it happens
+				try:
+					newTool = int(line[1:].split(b";")[0])
+				except ValueError:
+					continue
+
+				if newTool != tool:
+					timeline.append((lineStart, tool, toolE))
+					toolFilament[tool] = toolE
+					tool = newTool
+					toolE = toolFilament.get(tool, 0.0)
+					timeline.append((lineStart, tool, toolE))
+
+			continue
+
+		comment = line.find(b";")
+		words = (line[:comment] if comment >= 0 else line).split()
+		if not words:
+			continue
+
+		cmd = words[0]
+
+		if cmd == b"G1" or cmd == b"G0":
+			nx = x
+			ny = y
+			nz = z
+			de = 0.0
+			for w in words[1:]:
+				a = w[:1]
+				try:
+					v = float(w[1:])
+				except ValueError:
+					continue
+
+				if a == b"X":
+					nx = x + v if relative else v
+				elif a == b"Y":
+					ny = y + v if relative else v
+				elif a == b"Z":
+					nz = z + v if relative else v
+				elif a == b"E":
+					if eRelative:
+						de = v
+					else:
+						de = v - e
+						e = v
+				elif a == b"F":
+					f = v
+
+			dx = nx - x
+			dy = ny - y
+			dz = nz - z
+
+			if de:
+				toolE += de
+				if lineStart >= nextSample:
+					timeline.append((base + offset, tool, toolE))
+					nextSample = base + offset + TIMELINE_INTERVAL
+
+			if dz:
+				events.append((EVENT_Z_CHANGE, lineStart, time, nz))
+				eventMoves.append(len(moves))
+				extrudedSinceZ = False
+
+			if de > 0 and (dx or dy):
+				if not extrudedSinceZ:
+					events.append((EVENT_EXTRUSION, lineStart, time))
+					eventMoves.append(len(moves))
+					extrudedSinceZ = True
+
+				filament += de
+				if nx < minX: minX = nx
+				if nx > maxX: maxX = nx
+				if ny < minY: minY = ny
+				if ny > maxY: maxY = ny
+				if nz > maxZ: maxZ = nz
+				if x < minX: minX = x
+				if x > maxX: maxX = x
+				if y < minY: minY = y
+				if y > maxY: maxY = y
+
+			if f > 0:
+				if limits:
+					if dx or dy or dz or de:
+						moves.append((dx, dy, dz, de, f))
+				else:
+					dist = sqrt(dx*dx + dy*dy + dz*dz) if (dx or dy or dz) else abs(de)
+					time += dist * 60.0 / f
+
+			x = nx
+			y = ny
+			z = nz
+
+		elif cmd == b"G92":
+			if len(words) == 1:
+				x = y = z = e = 0.0
+			else:
+				for w in words[1:]:
+					a = w[:1]
+					try:
+						v = float(w[1:])
+					except ValueError:
+						continue
+
+					if a == b"X":
+						x = v
+					elif a == b"Y":
+						y = v
+					elif a == b"Z":
+						if v != z:
+							events.append((EVENT_Z_CHANGE, lineStart, time, v))
+							eventMoves.append(len(moves))
+							extrudedSinceZ = False
+						z = v
+					elif a == b"E":
+						e = v
+
+		elif cmd == b"G28":
+			#The head stops to home
+			if limits:
+				time = planPending(moves, eventMoves, events, firstEvent, state, time)
+				firstEvent = len(events)
+				state.previous = None
+
+			axes = [w[:1] for w in words[1:]]
+			homeAll = not (b"X" in axes or b"Y" in axes or b"Z" in axes)
+			if homeAll or b"X" in axes:
+				x = 0.0
+			if homeAll or b"Y" in axes:
+				y = 0.0
+			if (homeAll or b"Z" in axes) and z != 0.0:
+				events.append((EVENT_Z_CHANGE, lineStart, time, 0.0))
+				eventMoves.append(len(moves))
+				extrudedSinceZ = False
+				z = 0.0
+
+		elif cmd == b"G90":
+			relative = False
+			eRelative = False
+
+		elif cmd == b"G91":
+			relative = True
+			eRelative = True
+
+		elif cmd == b"M82":
+			eRelative = False
+
+		elif cmd == b"M83":
+			eRelative = True
+
+		elif cmd == b"G4":
+			if limits:
+				time = planPending(moves, eventMoves, events, firstEvent, state, time)
+				firstEvent = len(events)
+				state.previous = None
+
+			for w in words[1:]:
+				try:
+					if w[:1] == b"P":
+						time += float(w[1:]) / 1000.0
+					elif w[:1] == b"S":
+						time += float(w[1:])
+				except ValueError:
+					pass
+
+		elif cmd == b"M201" or cmd == b"M203" or cmd == b"M204" or cmd == b"M205":
+			#Moves so far are planned with the limits there were
+			if limits:
+				time = planPending(moves, eventMoves, events, firstEvent, state, time)
+				firstEvent = len(events)
+				limits.update(cmd.decode("ascii"), words[1:])
+
+	if limits:
+		time = planPending(moves, eventMoves, events, firstEvent, state, time)
+
+	state.x = x
+	state.y = y
+	state.z = z
+	state.e = e
+	state.f = f
+	state.relative = relative
+	state.eRelative = eRelative
+	state.tool = tool
+
+	toolFilament[tool] = toolE
+	result.nextSample = nextSample
+	result.time = time
+	result.filament = filament
+	result.minX = minX
+	result.minY = minY
+	result.maxX = maxX
+	result.maxY = maxY
+	result.maxZ = maxZ
+	result.offset = base + offset
+
+	return result
+
+def lineBoundaries(f, start, end, size):
+	# Offsets splitting [start, end) of the file in ranges of about size bytes, all of them at the beginning of a line
+	boundaries = [start]
+	position = start + size
+
+	while position < end:
+		f.seek(position - 1)
+		f.readline()
+		position = f.tell()
+		if position >= end:
+			break
+
+		boundaries.append(position)
+		position += size
+
+	boundaries.append(end)
+	return boundaries
+
+def scanFile(f, start, end, state, result, checkpoints=None, progress=None):
+	# Scans the line aligned range [start, end) of the file mapping a segment and scanning a window at a time. When a
+	# checkpoints list is given, a checkpoint is appended to it after every window, and progress is called with the
+	# result after every window.
+	boundaries = lineBoundaries(f, start, end, SEGMENT_SIZE)
+
+	for segmentStart, segmentEnd in zip(boundaries[:-1], boundaries[1:]):
+		base = segmentStart - segmentStart % mmap.ALLOCATIONGRANULARITY
+		mm = mmap.mmap(f.fileno(), segmentEnd - base, access=mmap.ACCESS_READ, offset=base)
+		try:
+			position = segmentStart
+			while position < segmentEnd:
+				if checkpoints is None:
+					scanRange(mm, position - base, min(position + WINDOW_SIZE, segmentEnd) - base, state, result, base)
+
+				else:
+					bounds = result.bounds()
+					result.resetBounds()
+					scanRange(mm, position - base, min(position + WINDOW_SIZE, segmentEnd) - base, state, result, base)
+					checkpoints.append(Checkpoint(result.offset, state.snapshot(), result, result.bounds()))
+					result.addBounds(bounds)
+
+				position = result.offset
+				if progress:
+					progress(result)
+
+		finally:
+			mm.close()
+
+def scanChunk(chunk):
+	# Process pool worker, scans a chunk (filename, start, end, initial state snapshot) of the file
+	filename, start, end, initial = chunk
+	state = ScanState.fromSnapshot(initial)
+	result = ScanResult()
+
+	checkpoints = []
+	with open(filename, "rb") as f:
+		scanFile(f, start, end, state, result, checkpoints)
+
+	return ChunkScan(start, end, initial, result, checkpoints)
+
+def stitchChunk(f, chunk, state, result):
+	# Appends the scan of a chunk to the result of the ones before it. state is the real state at the beginning of
+	# the chunk, it's left as the one at its end.
+	if state.snapshot() == chunk.initial:
+		result.append(chunk.result)
+		state.restore(chunk.checkpoints[-1].state)
+		return
+
+	# The guess was wrong. The beginning of the chunk is scanned again from the real state, a checkpoint at a time,
+	# until it gets to the same state as the guessed scan. That's usually at the first layer change, where X, Y, Z,
+	# E and F are set. From there on the guessed scan is right, only its times and filament are off by a constant.
+	rescan = ScanResult()
+	position = chunk.start
+
+	for i, checkpoint in enumerate(chunk.checkpoints):
+		scanFile(f, position, checkpoint.offset, state, rescan)
+		position = checkpoint.offset
+
+		if state.snapshot() == checkpoint.state:
+			guessed = chunk.result
+			tail = ScanResult()
+			tail.time = guessed.time - checkpoint.time
+			tail.filament = guessed.filament - checkpoint.filament
+			tail.toolFilament = dict((tool, filament - checkpoint.toolFilament.get(tool, 0.0)) for tool, filament in guessed.toolFilament.items())
+			tail.offset = guessed.offset
+			tail.nextSample = guessed.nextSample
+			for later in chunk.checkpoints[i+1:]:
+				tail.addBounds(later.bounds)
+
+			delta = -checkpoint.time
+			timeline = ((s[0], s[1], s[2] - checkpoint.toolFilament.get(s[1], 0.0)) for s in guessed.timeline[checkpoint.samples:])
+			rescan.append(tail, ((e[0], e[1], e[2] + delta) + e[3:] for e in guessed.events[checkpoint.events:]), timeline)
+			state.restore(chunk.checkpoints[-1].state)
+			break
+
+	result.append(rescan)
+
+def availableCpus():
+	if hasattr(os, "sched_getaffinity"):
+		return len(os.sched_getaffinity(0))
+
+	return multiprocessing.cpu_count()
+
+def scanParallel(f, filename, fileSize, jobs, initial, result, progress=None):
+	# The file is split in line aligned chunks scanned at the same time by a pool of processes. Only the state at the
+	# beginning of the first chunk is known, the rest are scanned from the state after the header of the file, where
+	# the start gcode sets the positioning modes, and fixed by the stitching pass.
+	guess = ScanState.fromSnapshot(initial.snapshot())
+	scanFile(f, 0, lineBoundaries(f, 0, fileSize, HEADER_SIZE)[1], guess, ScanResult())
+
+	boundaries = lineBoundaries(f, 0, fileSize, -(-fileSize // jobs))
+	chunks = [(filename, start, end, initial.snapshot() if start == 0 else guess.snapshot()) for start, end in zip(boundaries[:-1], boundaries[1:])]
+
+	try:
+		pool = multiprocessing.Pool(min(jobs, len(chunks)))
+
+	except (OSError, RuntimeError):
+		#No room for the pool (memory limit, no shared memory...), do it in this process
+		scanFile(f, 0, fileSize, initial, result, progress=progress)
+		return
+
+	try:
+		#Chunks are stitched in order as they are done
+		state = initial
+		for chunk in pool.imap(scanChunk, chunks):
+			stitchChunk(f, chunk, state, result)
+			if progress:
+				progress(result)
+
+		pool.close()
+
+	finally:
+		pool.terminate()
+
+class LayerBuilder(object):
+	# Turns the scanner events into a list of (startOffset, startTime, z) for every layer. A layer starts with the
+	# move that took the head to a new Z on which there was extrusion afterwards. Everything before the first layer
+	# (start gcode, heating...) is accounted in the first one. Events can be fed as they are scanned.
+
+	def __init__(self):
+		self.starts = []
+		self.processed = 0 #events fed so far
+		self._layerZ = None
+		self._currentZ = 0.0
+		self._lastZChange = (0, 0.0)
+
+	def feed(self, events):
+		# Processes the events not fed yet of the list, returns the layer starts
+		starts = self.starts
+		layerZ = self._layerZ
+		currentZ = self._currentZ
+		lastZChange = self._lastZChange
+
+		for i in range(self.processed, len(events)):
+			event = events[i]
+			if event[0] == EVENT_Z_CHANGE:
+				currentZ = event[3]
+				lastZChange = (event[1], event[2])
+
+			elif layerZ is None:
+				starts.append((0, 0.0, currentZ))
+				layerZ = currentZ
+
+			elif abs(currentZ - layerZ) > LAYER_Z_EPSILON:
+				starts.append((lastZChange[0], lastZChange[1], currentZ))
+				layerZ = currentZ
+
+		self.processed = len(events)
+		self._layerZ = layerZ
+		self._currentZ = currentZ
+		self._lastZChange = lastZChange
+		return starts
+
+def buildLayers(events):
+	return LayerBuilder().feed(events)
+
+def makeResult(starts, result, fileSize, layersInfo=True, scanned=None):
+	# scanned is the number of bytes scanned for a partial result. Its last layer ends there and the print time is
+	# extrapolated from the time of the part scanned.
+	totalTime = result.time
+	layerCount = len(starts)
+	end = fileSize
+
+	if scanned is not None and scanned < fileSize:
+		end = scanned
+		if scanned:
+			totalTime = result.time * fileSize / scanned
+
+	if layerCount > 1:
+		layerHeight = starts[1][2] - starts[0][2]
+	elif layerCount == 1:
+		layerHeight = starts[0][2]
+	else:
+		layerHeight = 0.0
+
+	if result.maxX >= result.minX:
+		size = {"x": round(result.maxX - result.minX, 3), "y": round(result.maxY - result.minY, 3), "z": round(result.maxZ, 3)}
+	else:
+		size = {"x": 0.0, "y": 0.0, "z": 0.0}
+
+	data = {
+		"size": size,
+		"layer_count": layerCount,
+		"layer_height": round(layerHeight, 2),
+		"print_time": round(totalTime, 2),
+		"total_filament": round(result.filament, 3)
+	}
+
+	if end < fileSize:
+		data["partial"] = True
+	else:
+		#Closed with the filament of every tool at the end of the file
+		data["filament_timeline"] = FilamentTimeline.fromSamples(result.timeline + [(fileSize, tool, filament) for tool, filament in sorted(result.toolFilament.items())])
+
+	if layersInfo:
+		upperPercent = array('d')
+		time = array('d')
+		start = array('q', (layer[0] for layer in starts))
+		for i in range(layerCount):
+			if i + 1 < layerCount:
+				upperOffset = starts[i+1][0]
+				layerTime = starts[i+1][1] - starts[i][1]
+			else:
+				upperOffset = end
+				layerTime = result.time - starts[i][1]
+
+			time.append(layerTime / totalTime if totalTime else 0.0)
+			upperPercent.append(float(upperOffset) / fileSize if fileSize else 1.0)
+
+		data["layers"] = LayerTable(upperPercent, time, start)
+
+	return data
+
+def analyze(filename, layersInfo=True, jobs=1, limits=None, onPartial=None, partialInterval=None):
+	# limits: MotionLimits to plan the moves with, firmware defaults if not given. Ignored without NumPy.
+	# onPartial is called with a partial result every partialInterval bytes scanned.
+	fileSize = os.path.getsize(filename)
+	result = ScanResult()
+	planned = planner.numpy is not None
+	initial = ScanState((limits or MotionLimits()).copy() if planned else None)
+	builder = LayerBuilder()
+	progress = None
+
+	if onPartial and partialInterval:
+		published = [0]
+
+		def progress(result):
+			if result.offset - published[0] >= partialInterval and result.offset < fileSize:
+				published[0] = result.offset
+				data = makeResult(builder.feed(result.events), result, fileSize, layersInfo, result.offset)
+				data["planned"] = planned
+				onPartial(data)
+
+	if fileSize:
+		with open(filename, "rb") as f:
+			if jobs > 1 and fileSize >= PARALLEL_MIN_SIZE:
+				scanParallel(f, filename, fileSize, jobs, initial, result, progress)
+			else:
+				scanFile(f, 0, fileSize, initial, result, progress=progress)
+
+	data = makeResult(builder.feed(result.events), result, fileSize, layersInfo)
+	data["planned"] = planned
+	return data
+
+def main(argv):
+	jobs = 0
+	limits = None
+	binary = False
+	output = None
+	partialInterval = None
+	args = []
+	for arg in argv[1:]:
+		if arg.startswith("--jobs="):
+			jobs = int(arg[7:])
+		elif arg.startswith("--limits="):
+			limits = MotionLimits.fromDict(json.loads(arg[9:]))
+		elif arg.startswith("--format="):
+			binary = arg[9:] == "binary"
+		elif arg.startswith("--output="):
+			output = arg[9:]
+		elif arg.startswith("--partial="):
+			partialInterval = int(float(arg[10:]) * 1024 * 1024)
+		else:
+			args.append(arg)
+
+	if not args:
+		sys.stderr.write("Please include the file to analyze.\n")
+		return 1
+
+	filename = args[0]
+	if not os.path.isfile(filename):
+		sys.stderr.write("%s is not a valid file.\n" % filename)
+		return 1
+
+	layersInfo = len(args) > 1 and args[1] == "1"
+	out = open(output, "wb") if output else sys.stdout.buffer
+	try:
+		def publish(gcodeData):
+			out.write(resultformat.dumps(gcodeData))
+			out.flush()
+
+		gcodeData = analyze(filename, layersInfo, jobs or availableCpus(), limits, publish if binary else None, partialInterval)
+		out.write(resultformat.dumps(gcodeData) if binary else resultformat.toJSON(gcodeData).encode("utf-8"))
+
+	except (MemoryError, OSError) as e:
+		#Mapping the file fails with ENOMEM instead of MemoryError when the address space is limited
+		if isinstance(e, OSError) and e.errno != errno.ENOMEM:
+			raise
+
+		sys.stderr.write("Out of memory analyzing %s\n" % filename)
+		return EXIT_OUT_OF_MEMORY
+
+	finally:
+		if output:
+			out.close()
+
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv))
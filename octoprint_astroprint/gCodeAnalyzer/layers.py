@@ -0,0 +1,65 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+class LayerTable(object):
+	# Per layer information of an analyzed job kept in parallel arrays of doubles instead of a list of dicts, it
+	# lives for the whole print and jobs can have tens of thousands of layers. upperPercent and time can also be
+	# memoryviews of doubles, as read from a binary analyzer result.
+	#
+	# upperPercent[i]: fraction of the file where layer i+1 ends
+	# time[i]: fraction of the total print time spent in layer i+1
+	# timeBefore[i]: fraction of the total print time spent in the layers below layer i+1
+	# start[i]: byte offset where layer i+1 starts, sorted. None when the analyzer doesn't give them (native engine).
+	__slots__ = ('upperPercent', 'time', 'timeBefore', 'start')
+
+	def __init__(self, upperPercent=None, time=None, start=None):
+		self.upperPercent = upperPercent if upperPercent is not None else array('d')
+		self.time = time if time is not None else array('d')
+		self.start = start
+		self.timeBefore = array('d')
+
+		accumulated = 0.0
+		for layerTime in self.time:
+			self.timeBefore.append(accumulated)
+			accumulated += layerTime
+
+	@classmethod
+	def fromLayerList(cls, layers):
+		upperPercent = array('d')
+		time = array('d')
+		start = array('q') if layers and all('start' in layer for layer in layers) else None
+		for layer in layers:
+			upperPercent.append(layer['upperPercent'])
+			time.append(layer['time'])
+			if start is not None:
+				start.append(layer['start'])
+
+		return cls(upperPercent, time, start)
+
+	def toLayerList(self):
+		if self.start is None:
+			return [{'upperPercent': u, 'time': t} for u, t in zip(self.upperPercent, self.time)]
+
+		return [{'upperPercent': u, 'time': t, 'start': s} for u, t, s in zip(self.upperPercent, self.time, self.start)]
+
+	def layerAt(self, filePercent):
+		# 1 based number of the layer being printed when the given fraction of the file has been sent
+		return min(bisect_left(self.upperPercent, filePercent), len(self.upperPercent) - 1) + 1
+
+	def layerAtOffset(self, filePos):
+		# 1 based number of the layer the byte at filePos of the file belongs to, needs the start offsets
+		return max(bisect_right(self.start, filePos), 1)
+
+	def layerRange(self, layer):
+		# (start, end) byte offsets of a 1 based layer, end is None for the last one (end of the file)
+		return self.start[layer - 1], self.start[layer] if layer < len(self.start) else None
+
+	def __len__(self):
+		return len(self.upperPercent)
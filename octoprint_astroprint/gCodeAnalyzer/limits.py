@@ -0,0 +1,92 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+#Commands setting the motion limits of the firmware
+LIMIT_COMMANDS = ("M201", "M203", "M204", "M205")
+
+AXES = ("X", "Y", "Z", "E")
+
+class MotionLimits(object):
+	# Motion limits used to plan the moves (Marlin units: mm/s and mm/s^2, per axis values in X, Y, Z, E order).
+	# Defaults are Marlin's.
+
+	def __init__(self, maxFeedrate=(300.0, 300.0, 5.0, 25.0), maxAcceleration=(3000.0, 3000.0, 100.0, 10000.0), acceleration=3000.0, retractAcceleration=3000.0, travelAcceleration=3000.0, jerk=(10.0, 10.0, 0.3, 5.0)):
+		self.maxFeedrate = list(maxFeedrate)
+		self.maxAcceleration = list(maxAcceleration)
+		self.acceleration = float(acceleration)
+		self.retractAcceleration = float(retractAcceleration)
+		self.travelAcceleration = float(travelAcceleration)
+		self.jerk = list(jerk)
+
+	def snapshot(self):
+		return tuple(self.maxFeedrate) + tuple(self.maxAcceleration) + (self.acceleration, self.retractAcceleration, self.travelAcceleration) + tuple(self.jerk)
+
+	@classmethod
+	def fromSnapshot(cls, snapshot):
+		return cls(snapshot[0:4], snapshot[4:8], snapshot[8], snapshot[9], snapshot[10], snapshot[11:15])
+
+	def copy(self):
+		return MotionLimits(self.maxFeedrate, self.maxAcceleration, self.acceleration, self.retractAcceleration, self.travelAcceleration, self.jerk)
+
+	def toDict(self):
+		return {
+			'max_feedrate': list(self.maxFeedrate),
+			'max_acceleration': list(self.maxAcceleration),
+			'acceleration': self.acceleration,
+			'retract_acceleration': self.retractAcceleration,
+			'travel_acceleration': self.travelAcceleration,
+			'jerk': list(self.jerk)
+		}
+
+	@classmethod
+	def fromDict(cls, data):
+		limits = cls()
+		if data:
+			limits.maxFeedrate = [float(v) for v in data.get('max_feedrate', limits.maxFeedrate)]
+			limits.maxAcceleration = [float(v) for v in data.get('max_acceleration', limits.maxAcceleration)]
+			limits.acceleration = float(data.get('acceleration', limits.acceleration))
+			limits.retractAcceleration = float(data.get('retract_acceleration', limits.retractAcceleration))
+			limits.travelAcceleration = float(data.get('travel_acceleration', limits.travelAcceleration))
+			limits.jerk = [float(v) for v in data.get('jerk', limits.jerk)]
+
+		return limits
+
+	def update(self, command, words):
+		# Applies one of the LIMIT_COMMANDS, words are its parameters (ex: ["X500", "Y500"]), bytes or text. Returns
+		# whether anything changed.
+		before = self.snapshot()
+
+		for word in words:
+			if isinstance(word, bytes):
+				word = word.decode("ascii", "ignore")
+
+			param = word[:1].upper()
+			try:
+				value = float(word[1:])
+
+			except ValueError:
+				continue
+
+			if command == "M201" and param in AXES:
+				self.maxAcceleration[AXES.index(param)] = value
+			elif command == "M203" and param in AXES:
+				self.maxFeedrate[AXES.index(param)] = value
+			elif command == "M204":
+				if param == "P":
+					self.acceleration = value
+				elif param == "R":
+					self.retractAcceleration = value
+				elif param == "T":
+					self.travelAcceleration = value
+				elif param == "S":
+					#Older firmwares, printing and travel
+					self.acceleration = value
+					self.travelAcceleration = value
+			elif command == "M205" and param in AXES:
+				self.jerk[AXES.index(param)] = value
+
+		return self.snapshot() != before
@@ -0,0 +1,89 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Print time of a batch of moves planned the way the firmware does it. Every move is a trapezoid (accelerate,
+# cruise, decelerate):
+#
+# - its cruise speed is the feedrate limited by the maximum feedrate of the axes it moves
+# - its acceleration is the printing, retract or travel one limited by the maximum acceleration of the axes it moves
+# - the speed at the junction with the next move is limited by the jerk of every axis
+# - entry and exit speeds are limited by what can be reached accelerating from the previous moves and decelerating
+#   to the next ones. Working with squared speeds these are a running min of a cumulative sum, so they are solved for
+#   the whole batch at once instead of move by move.
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+def _perAxis(limits, components):
+	# Per move minimum of limit/component over the axes the move uses
+	values = numpy.full_like(components, numpy.inf)
+	numpy.divide(numpy.asarray(limits, dtype=numpy.float64), components, out=values, where=components > 0)
+	return values.min(axis=1)
+
+def planMoves(moves, limits, previous=None):
+	# moves: list of (dx, dy, dz, de, f) with f in mm/min, all of them with some length. previous is the direction and
+	# speed of the move before the batch as returned by the last call. Returns the accumulated time at the end of
+	# every move and the direction and speed of the last one.
+	data = numpy.array(moves, dtype=numpy.float64)
+	deltas = data[:, :4]
+
+	length = numpy.sqrt((deltas[:, :3] ** 2).sum(axis=1))
+	extrudeOnly = length == 0
+	length[extrudeOnly] = numpy.abs(deltas[extrudeOnly, 3])
+
+	unit = deltas / length[:, None]
+	components = numpy.abs(unit)
+
+	speed = numpy.minimum(data[:, 4] / 60.0, _perAxis(limits.maxFeedrate, components))
+
+	acceleration = numpy.where(deltas[:, 3] > 0, limits.acceleration, limits.travelAcceleration)
+	acceleration[extrudeOnly] = limits.retractAcceleration
+	acceleration = numpy.minimum(acceleration, _perAxis(limits.maxAcceleration, components))
+
+	#Speed at which a move can start from or stop to rest
+	safeSpeed = numpy.minimum(speed, _perAxis(limits.jerk, components))
+
+	#Maximum speed at the n+1 nodes: start of every move and end of the last one
+	nodes = numpy.empty(len(speed) + 1)
+	nodes[1:-1] = numpy.minimum(numpy.minimum(speed[1:], speed[:-1]), _perAxis(limits.jerk, numpy.abs(unit[1:] - unit[:-1])))
+	nodes[-1] = safeSpeed[-1]
+	if previous is not None:
+		previousUnit, previousSpeed = previous
+		nodes[0] = min(previousSpeed, speed[0], _perAxis(limits.jerk, numpy.abs(unit[:1] - previousUnit))[0])
+	else:
+		nodes[0] = safeSpeed[0]
+
+	# Squared speed gained/lost along every move is 2*a*L. Going backwards, entry^2 <= exit^2 + 2*a*L, which unrolls
+	# into min over the later nodes of (node^2 + sum of 2*a*L up to it), and the same forwards.
+	gain = 2.0 * acceleration * length
+	reach = numpy.zeros(len(nodes))
+	numpy.cumsum(gain, out=reach[1:])
+
+	squared = nodes ** 2
+	squared = numpy.minimum.accumulate((squared + reach)[::-1])[::-1] - reach
+	squared = numpy.minimum.accumulate(squared - reach) + reach
+	nodeSpeed = numpy.sqrt(numpy.maximum(squared, 0.0))
+
+	entry = nodeSpeed[:-1]
+	exit = nodeSpeed[1:]
+
+	accelerating = (speed ** 2 - entry ** 2) / (2.0 * acceleration)
+	decelerating = (speed ** 2 - exit ** 2) / (2.0 * acceleration)
+	cruising = length - accelerating - decelerating
+
+	#Moves too short to get to the cruise speed only accelerate to a peak and decelerate
+	peak = numpy.minimum(numpy.sqrt(numpy.maximum((gain + entry ** 2 + exit ** 2) / 2.0, 0.0)), speed)
+
+	time = numpy.where(
+		cruising > 0,
+		(speed - entry) / acceleration + (speed - exit) / acceleration + numpy.maximum(cruising, 0.0) / speed,
+		(2.0 * peak - entry - exit) / acceleration
+	)
+
+	return numpy.cumsum(time), (unit[-1], speed[-1])
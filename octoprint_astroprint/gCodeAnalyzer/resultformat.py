@@ -0,0 +1,174 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+# Binary format of the analyzer results, 24 bytes per layer instead of the tens of a JSON layer list.
+#
+#    header (64 bytes, little endian):
+#        magic "APGA", version (uint16), flags (uint16), layer count (uint32),
+#        size x, size y, size z, layer height, print time, total filament (double), 4 bytes padding
+#    upperPercent of every layer (double)
+#    time of every layer (double)
+#    start byte offset of every layer (int64), when flagged FLAG_OFFSETS
+#    filament timeline section (see FilamentTimeline.pack), when flagged FLAG_TIMELINE
+#
+# The layer arrays are used in place, as memoryviews over the buffer read, by the LayerTable of the result. Anything
+# not starting with the magic is read as the JSON the native analyzer writes.
+#
+# The engine can write partial results, for the part of the file scanned so far, before the complete one. They are
+# flagged FLAG_PARTIAL and their last layer ends where the scan got to.
+
+import json
+import struct
+import sys
+
+from array import array
+
+try:
+	from .layers import LayerTable
+	from .timeline import FilamentTimeline
+except ImportError:
+	#Imported by engine.py run as a script
+	from layers import LayerTable
+	from timeline import FilamentTimeline
+
+MAGIC = b"APGA"
+VERSION = 1
+
+FLAG_PLANNED = 0x1
+FLAG_LAYERS = 0x2
+FLAG_PARTIAL = 0x4
+FLAG_OFFSETS = 0x8
+FLAG_TIMELINE = 0x10
+
+HEADER = struct.Struct("<4sHHI6d4x")
+SECTION_SIZE = struct.Struct("<I")
+
+def dumps(gcodeData):
+	# gcodeData as returned by loads, with the layers (if any) as a LayerTable
+	layers = gcodeData.get('layers')
+	size = gcodeData['size']
+
+	timeline = gcodeData.get('filament_timeline')
+	offsets = layers is not None and layers.start is not None
+	flags = (FLAG_PLANNED if gcodeData.get('planned') else 0) | (FLAG_LAYERS if layers is not None else 0) | (FLAG_PARTIAL if gcodeData.get('partial') else 0) | (FLAG_OFFSETS if offsets else 0) | (FLAG_TIMELINE if timeline is not None else 0)
+	header = HEADER.pack(MAGIC, VERSION, flags, gcodeData['layer_count'], size['x'], size['y'], size['z'], gcodeData['layer_height'], gcodeData['print_time'], gcodeData['total_filament'] or 0.0)
+
+	timelineSection = timeline.pack() if timeline is not None else b""
+	if layers is None:
+		return header + timelineSection
+
+	upperPercent = array('d', layers.upperPercent)
+	time = array('d', layers.time)
+	start = array('q', layers.start if offsets else ())
+	if sys.byteorder != "little":
+		upperPercent.byteswap()
+		time.byteswap()
+		start.byteswap()
+
+	return header + upperPercent.tobytes() + time.tobytes() + start.tobytes() + timelineSection
+
+def loads(data):
+	# Decodes an analyzer result (bytes or bytearray), binary or JSON. Raises ValueError when it's neither.
+	if data[:len(MAGIC)] != MAGIC:
+		gcodeData = json.loads(data.decode('utf-8') if isinstance(data, (bytes, bytearray)) else data)
+		if 'layers' in gcodeData:
+			gcodeData['layers'] = LayerTable.fromLayerList(gcodeData['layers'])
+		if 'filament_timeline' in gcodeData:
+			gcodeData['filament_timeline'] = FilamentTimeline.fromDict(gcodeData['filament_timeline'])
+
+		return gcodeData
+
+	try:
+		magic, version, flags, layerCount, x, y, z, layerHeight, printTime, totalFilament = HEADER.unpack_from(data)
+
+	except struct.error:
+		raise ValueError("Truncated analyzer result")
+
+	if version != VERSION:
+		raise ValueError("Unknown analyzer result version %d" % version)
+
+	gcodeData = {
+		'size': {'x': x, 'y': y, 'z': z},
+		'layer_count': layerCount,
+		'layer_height': layerHeight,
+		'print_time': printTime,
+		'total_filament': totalFilament,
+		'planned': bool(flags & FLAG_PLANNED)
+	}
+
+	if flags & FLAG_PARTIAL:
+		gcodeData['partial'] = True
+
+	if flags & FLAG_LAYERS:
+		end = HEADER.size + layersSize(flags, layerCount)
+		if len(data) < end:
+			raise ValueError("Truncated analyzer result")
+
+		view = memoryview(data)[HEADER.size:end]
+		start = None
+		if sys.byteorder == "little":
+			upperPercent = view[:8 * layerCount].cast('d')
+			time = view[8 * layerCount:16 * layerCount].cast('d')
+			if flags & FLAG_OFFSETS:
+				start = view[16 * layerCount:].cast('q')
+		else:
+			upperPercent = array('d', view[:8 * layerCount].tobytes())
+			time = array('d', view[8 * layerCount:16 * layerCount].tobytes())
+			upperPercent.byteswap()
+			time.byteswap()
+			if flags & FLAG_OFFSETS:
+				start = array('q', view[16 * layerCount:].tobytes())
+				start.byteswap()
+
+		gcodeData['layers'] = LayerTable(upperPercent, time, start)
+
+	if flags & FLAG_TIMELINE:
+		gcodeData['filament_timeline'], _ = FilamentTimeline.unpack(data, HEADER.size + layersSize(flags, layerCount))
+
+	return gcodeData
+
+def layersSize(flags, layerCount):
+	# Bytes after the header
+	if not flags & FLAG_LAYERS:
+		return 0
+
+	return (24 if flags & FLAG_OFFSETS else 16) * layerCount
+
+def readResults(stream):
+	# Generator of the results read from a binary stream (the stdout of the engine), the partial ones first. When
+	# the stream isn't in the binary format, it's read to the end and decoded as a single result.
+	while True:
+		header = stream.read(HEADER.size)
+		if not header:
+			return
+
+		if header[:len(MAGIC)] != MAGIC:
+			yield loads(header + stream.read())
+			return
+
+		if len(header) < HEADER.size:
+			raise ValueError("Truncated analyzer result")
+
+		flags, layerCount = struct.unpack_from("<HI", header, 6)
+		layers = stream.read(layersSize(flags, layerCount))
+		timeline = b""
+		if flags & FLAG_TIMELINE:
+			timeline = stream.read(SECTION_SIZE.size)
+			if len(timeline) == SECTION_SIZE.size:
+				timeline += stream.read(SECTION_SIZE.unpack(timeline)[0])
+
+		yield loads(header + layers + timeline)
+
+def toJSON(gcodeData):
+	# The document the native analyzer writes
+	document = dict(gcodeData)
+	if 'layers' in document:
+		document['layers'] = document['layers'].toLayerList()
+	if 'filament_timeline' in document:
+		document['filament_timeline'] = document['filament_timeline'].toDict()
+
+	return json.dumps(document)
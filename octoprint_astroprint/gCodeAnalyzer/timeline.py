@@ -0,0 +1,115 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+import struct
+import sys
+
+from array import array
+from bisect import bisect_right
+
+#Samples of the analyzer engine are taken about this many bytes apart, and at every tool change
+TIMELINE_INTERVAL = 4096
+
+SECTION_HEADER = struct.Struct("<I")
+TOOL_HEADER = struct.Struct("<II")
+
+class FilamentTimeline(object):
+	# Filament extruded by every tool (net of retractions, mm of E) up to a byte offset of the file, so the filament
+	# consumed by a print is known from how far it got. For every tool there's a sorted array of offsets and one of
+	# the filament extruded by the tool up to them, the filament in between two samples is interpolated.
+
+	__slots__ = ('tools',)
+
+	def __init__(self, tools=None):
+		self.tools = tools or {} #tool number: (offsets, filament)
+
+	@classmethod
+	def fromSamples(cls, samples):
+		# samples: (offset, tool, filament extruded by the tool) in file order
+		tools = {}
+		for offset, tool, filament in samples:
+			if tool not in tools:
+				tools[tool] = (array('q'), array('d'))
+
+			offsets, extruded = tools[tool]
+			offsets.append(offset)
+			extruded.append(filament)
+
+		return cls(tools)
+
+	def filamentAt(self, filePos):
+		# Filament extruded by every tool ({"0": mm, ...}) when the file has been sent up to filePos
+		result = {}
+		for tool, (offsets, extruded) in self.tools.items():
+			i = bisect_right(offsets, filePos)
+			if i == 0:
+				#Before the first sample, from 0 at the beginning of the file
+				filament = extruded[0] * filePos / offsets[0] if offsets[0] else 0.0
+			elif i == len(offsets) or offsets[i] == offsets[i-1]:
+				filament = extruded[i-1]
+			else:
+				filament = extruded[i-1] + (extruded[i] - extruded[i-1]) * (filePos - offsets[i-1]) / (offsets[i] - offsets[i-1])
+
+			result[str(tool)] = max(filament, 0.0)
+
+		return result
+
+	def __len__(self):
+		return sum(len(offsets) for offsets, _ in self.tools.values())
+
+	def toDict(self):
+		return dict((str(tool), {'offsets': list(offsets), 'filament': list(extruded)}) for tool, (offsets, extruded) in self.tools.items())
+
+	@classmethod
+	def fromDict(cls, data):
+		return cls(dict((int(tool), (array('q', entry['offsets']), array('d', entry['filament']))) for tool, entry in data.items()))
+
+	def pack(self):
+		# Binary section of the analyzer results: its size, then for every tool its number, sample count, offsets (int64)
+		# and filament (double), little endian
+		parts = []
+		for tool, (offsets, extruded) in sorted(self.tools.items()):
+			offsets = array('q', offsets)
+			extruded = array('d', extruded)
+			if sys.byteorder != "little":
+				offsets.byteswap()
+				extruded.byteswap()
+
+			parts.append(TOOL_HEADER.pack(tool, len(offsets)))
+			parts.append(offsets.tobytes())
+			parts.append(extruded.tobytes())
+
+		data = b"".join(parts)
+		return SECTION_HEADER.pack(len(data)) + data
+
+	@classmethod
+	def unpack(cls, data, offset=0):
+		# Reads a section written by pack at the offset of data, returns (timeline, offset after the section)
+		try:
+			size, = SECTION_HEADER.unpack_from(data, offset)
+			position = offset + SECTION_HEADER.size
+			end = position + size
+			if len(data) < end:
+				raise ValueError("Truncated filament timeline")
+
+			tools = {}
+			while position < end:
+				tool, count = TOOL_HEADER.unpack_from(data, position)
+				position += TOOL_HEADER.size
+				offsets = array('q', bytes(data[position:position + 8 * count]))
+				extruded = array('d', bytes(data[position + 8 * count:position + 16 * count]))
+				if sys.byteorder != "little":
+					offsets.byteswap()
+					extruded.byteswap()
+
+				tools[tool] = (offsets, extruded)
+				position += 16 * count
+
+		except struct.error:
+			raise ValueError("Truncated filament timeline")
+
+		return cls(tools), end
@@ -0,0 +1,128 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+#Two extrusions closer than this in Z are considered to be in the same layer, as in the analyzer
+LAYER_Z_EPSILON = 0.001
+
+class LayerTracker(object):
+	# Follows the layers of the print from the commands sent to the printer, so they are known when there's no
+	# analysis of the file (failed or still running). A layer starts when there's extrusion on a new Z, the same
+	# rule the analyzer engines use, so the live layers and the ones of the analysis are the same. In spirals (vase
+	# mode) that makes every extruding move going up a layer, the notifications of the PrinterListener take care of
+	# them coming that fast. Only the commands changing positions or modes are looked at, any other costs a dictionary
+	# lookup.
+
+	def __init__(self, plugin, onLayerChanged):
+		self.plugin = plugin
+		self._onLayerChanged = onLayerChanged
+		self._handlers = {
+			"G0": self._move,
+			"G1": self._move,
+			"G28": self._home,
+			"G90": self._setAbsolute,
+			"G91": self._setRelative,
+			"G92": self._setPosition,
+			"M82": self._setAbsoluteE,
+			"M83": self._setRelativeE
+		}
+		self._relative = False
+		self._eRelative = False
+		self.startPrint()
+
+	def startPrint(self):
+		self._x = 0.0
+		self._y = 0.0
+		self._z = 0.0
+		self._e = 0.0
+		self._layerZ = None
+		self._layerCount = 0
+
+	def gcodeSent(self, gcode, cmd):
+		handler = self._handlers.get(gcode)
+		if handler:
+			handler(cmd)
+
+	def _params(self, cmd):
+		params = {}
+		for word in cmd.split()[1:]:
+			if word[0] == ';':
+				break
+
+			try:
+				params[word[0].upper()] = float(word[1:])
+
+			except (ValueError, IndexError):
+				pass
+
+		return params
+
+	def _move(self, cmd):
+		params = self._params(cmd)
+		relative = self._relative
+		moved = False
+
+		if 'X' in params:
+			x = self._x + params['X'] if relative else params['X']
+			moved = x != self._x
+			self._x = x
+
+		if 'Y' in params:
+			y = self._y + params['Y'] if relative else params['Y']
+			moved = moved or y != self._y
+			self._y = y
+
+		if 'Z' in params:
+			self._z = self._z + params['Z'] if relative else params['Z']
+
+		if 'E' in params:
+			if self._eRelative:
+				extruded = params['E'] > 0
+				self._e += params['E']
+			else:
+				extruded = params['E'] > self._e
+				self._e = params['E']
+
+			if extruded and moved and (self._layerZ is None or abs(self._z - self._layerZ) > LAYER_Z_EPSILON):
+				self._layerZ = self._z
+				self._layerCount += 1
+				self._onLayerChanged(self._layerCount, self._z)
+
+	def _home(self, cmd):
+		params = cmd.split()[1:]
+		homeAll = not any(p[0].upper() in "XYZ" for p in params if p)
+		if homeAll or any(p[0].upper() == "X" for p in params if p):
+			self._x = 0.0
+		if homeAll or any(p[0].upper() == "Y" for p in params if p):
+			self._y = 0.0
+		if homeAll or any(p[0].upper() == "Z" for p in params if p):
+			self._z = 0.0
+
+	def _setPosition(self, cmd):
+		params = self._params(cmd)
+		if not params:
+			self._x = self._y = self._z = self._e = 0.0
+			return
+
+		self._x = params.get('X', self._x)
+		self._y = params.get('Y', self._y)
+		self._z = params.get('Z', self._z)
+		self._e = params.get('E', self._e)
+
+	#In Marlin G90 and G91 also change the relative nature of extrusion
+	def _setAbsolute(self, cmd):
+		self._relative = False
+		self._eRelative = False
+
+	def _setRelative(self, cmd):
+		self._relative = True
+		self._eRelative = True
+
+	def _setAbsoluteE(self, cmd):
+		self._eRelative = False
+
+	def _setRelativeE(self, cmd):
+		self._eRelative = True
@@ -5,11 +5,56 @@ __author__ = "AstroPrint Product Team <product@astroprint.com>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
 
-import re
+from collections import deque
+from threading import Thread, Event, Lock
 
-from copy import copy
+#Characters a number parameter can be made of
+NUMBER_CHARS = frozenset("0123456789.-+")
+
+#Commands sent waiting to be counted. When the buffer is full, the thread sending them counts them itself.
+BUFFER_SIZE = 4096
+
+#The counting thread is woken up every this many commands sent, or after FLUSH_INTERVAL secs
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 1.0
+
+def commandParam(cmd, letter, start=1):
+	# Value of a parameter (ex: E in "G1 X10 E1.5") of the command as a float, None if it isn't there or isn't a
+	# number. Faster than a regex for the few parameters looked at on every line sent.
+	i = cmd.find(letter, start)
+	if i == -1:
+		return None
+
+	#Parameters are usually separated by spaces
+	end = cmd.find(" ", i)
+	try:
+		return float(cmd[i+1:end] if end != -1 else cmd[i+1:])
+
+	except ValueError:
+		pass
+
+	end = i + 1
+	length = len(cmd)
+	while end < length and cmd[end] in NUMBER_CHARS:
+		end += 1
+
+	try:
+		return float(cmd[i+1:end])
+
+	except ValueError:
+		return None
 
 class MaterialCounter(object):
+	# Counts the filament extruded by every tool from the commands sent to the printer. The E position is the
+	# printer's, shared by all the tools: in absolute extrusion mode what's extruded since the last reset, tool
+	# change or mode change (the open segment) is added to the active tool when the segment is closed.
+	#
+	# The commands are only buffered in the thread sending them (commandSent) and counted in batches by the
+	# counter's own thread. Reading the counters counts what's buffered first.
+	#
+	# When the analysis of the file printing has its filament timeline, the filament consumed is looked up there
+	# from the position in the file instead. The commands sent are still counted for prints without it (files
+	# streamed or printed from SD, analysis failed or not done yet).
 
 	#Extrusion modes
 	EXTRUSION_MODE_ABSOLUTE = 1
@@ -20,17 +65,27 @@ class MaterialCounter(object):
 		self._logger = self.plugin.get_logger()
 		self._extrusionMode = self.EXTRUSION_MODE_ABSOLUTE
 		self._activeTool = "0"
-		self._lastExtruderLengthReset = {"0": 0}
-		self._consumedFilament = {"0": 0}
-		self._lastExtrusion = {"0": 0}
-
-
-		# regexes
-		floatPattern = r"[-+]?[0-9]*\.?[0-9]+"
-		intPattern = r"\d+"
-		self._regex_paramEFloat = re.compile("E(%s)" % floatPattern)
-		self._regex_paramTInt = re.compile("T(%s)" % intPattern)
-
+		self._consumedFilament = {"0": 0.0} #closed segments of every tool
+		self._e = 0.0 #E position
+		self._segmentStart = 0.0 #E position where the open segment started
+		self._filamentTimeline = None
+		self._buffer = deque()
+		self._countLock = Lock()
+		self._wakeUp = Event()
+		self._shutdown = False
+		self._worker = None
+
+		#Commands changing the counters, anything else sent costs a dictionary lookup
+		self._handlers = {
+			"G0": self._gcode_G0,
+			"G1": self._gcode_G1,
+			"G90": self._gcode_G90,
+			"G91": self._gcode_G91,
+			"G92": self._gcode_G92,
+			"M82": self._gcode_M82,
+			"M83": self._gcode_M83,
+			"T": self._gcode_T
+		}
 
 	@property
 	def extrusionMode(self):
@@ -38,115 +93,147 @@ class MaterialCounter(object):
 
 	@property
 	def consumedFilament(self):
-		if self._consumedFilament and self._extrusionMode == self.EXTRUSION_MODE_ABSOLUTE:
-			tool = self._activeTool
-			consumedFilament = copy(self._consumedFilament)
-
-			try:
-				consumedFilament[tool] += ( self._lastExtrusion[tool] - self._lastExtruderLengthReset[tool] )
-
-			except KeyError:
-				return None
+		timeline = self._filamentTimeline
+		if timeline:
+			filePos = self.filePosition()
+			if filePos is not None:
+				return timeline.filamentAt(filePos)
 
-			return consumedFilament
+		with self._countLock:
+			self._flush()
+			consumedFilament = dict(self._consumedFilament)
+			if self._extrusionMode == self.EXTRUSION_MODE_ABSOLUTE:
+				consumedFilament[self._activeTool] += self._e - self._segmentStart
 
-		else:
-			return { k: max(v,0) for k, v in self._consumedFilament.items() } #It can be negative because of retraction but we can't "consume" negative filament
+		return { k: max(v,0) for k, v in consumedFilament.items() } #It can be negative because of retraction but we can't "consume" negative filament
 
 	@property
 	def totalConsumedFilament(self):
-		consumedFilament = self.consumedFilament
-		return sum([consumedFilament[k] for k in consumedFilament.keys()])
+		return sum(self.consumedFilament.values())
 
-	def startPrint(self):
-		tool = self._activeTool
-		self._lastExtruderLengthReset = {tool: 0}
-		self._consumedFilament = {tool: 0}
-		self._lastExtrusion = {tool: 0}
+	def filePosition(self):
+		try:
+			return self.plugin.get_printer().get_current_data()['progress']['filepos']
 
+		except (KeyError, TypeError):
+			return None
 
-	def _gcode_T(self, cmd): #changeActiveTool
-		toolMatch = self._regex_paramTInt.search(cmd)
-		if toolMatch:
-			tool = int(toolMatch.group(1))
-			if self._activeTool != tool:
-				newTool = str(tool)
-				oldTool =  str(self._activeTool)
-				#Make sure the head is registered
-				if newTool not in self._consumedFilament:
-					self._consumedFilament[newTool] = 0
-					self._lastExtruderLengthReset[newTool] = 0
-					self._lastExtrusion[newTool] = 0
-
-				if self._extrusionMode == self.EXTRUSION_MODE_ABSOLUTE:
-					if oldTool in self.consumedFilament and oldTool in self._lastExtrusion and oldTool in self._lastExtruderLengthReset:
-						self.consumedFilament[oldTool] += ( self._lastExtrusion[oldTool] - self._lastExtruderLengthReset[oldTool] )
-						self._lastExtruderLengthReset[oldTool] = self.consumedFilament[oldTool]
-					else:
-						self._logger.error('Unkonwn previous tool %s when trying to change to new tool %s' % (oldTool, newTool))
-				self._activeTool = newTool
+	def setFilamentTimeline(self, timeline):
+		# FilamentTimeline of the file printing, None to count the commands sent
+		self._filamentTimeline = timeline
 
-	def _gcode_G92(self, cmd):
-		# At the moment this command is only relevant in Absolute Extrusion Mode
-		if self._extrusionMode == self.EXTRUSION_MODE_ABSOLUTE:
-			eValue = None
-
-			if cmd.strip() == 'G92': #A simple G92 command resets all axis so E is now set to 0
-				eValue = 0
-			elif 'E' in cmd:
-				match = self._regex_paramEFloat.search(cmd)
-				if match:
-					try:
-						eValue = float(match.group(1))
+	def startPrint(self):
+		self._filamentTimeline = None
+		with self._countLock:
+			#Commands sent before the print started still change the modes and tool
+			self._flush()
+			self._consumedFilament = {self._activeTool: 0.0}
+			self._e = 0.0
+			self._segmentStart = 0.0
+
+	def start(self):
+		self._worker = Thread(target=self._run, name="Material Counter")
+		self._worker.daemon = True
+		self._worker.start()
+
+	def shutdown(self):
+		self._shutdown = True
+		self._wakeUp.set()
+
+	def commandSent(self, gcode, cmd):
+		# Called for every command sent, in the thread sending them. Without the counting thread running, or when it
+		# falls behind, the commands are counted right away.
+		buffer = self._buffer
+		buffer.append((gcode, cmd))
+
+		if len(buffer) >= BUFFER_SIZE or not self._worker:
+			self.flush()
+		elif len(buffer) % BATCH_SIZE == 0:
+			self._wakeUp.set()
+
+	def gcodeSent(self, gcode, cmd):
+		handler = self._handlers.get(gcode)
+		if handler:
+			handler(cmd)
+
+	def flush(self):
+		with self._countLock:
+			self._flush()
+
+	def _flush(self):
+		#Called with the count lock held, commands are taken out one at a time so they are counted in order
+		buffer = self._buffer
+		gcodeSent = self.gcodeSent
+		while buffer:
+			gcode, cmd = buffer.popleft()
+			gcodeSent(gcode, cmd)
+
+	def _run(self):
+		self.plugin.get_resource_policy().applyToCurrentThread("Material Counter")
+
+		while not self._shutdown:
+			self._wakeUp.wait(FLUSH_INTERVAL)
+			self._wakeUp.clear()
 
-					except ValueError:
-						pass
+			try:
+				self.flush()
 
-			if eValue is not None:
-				#There has been an E reset
-				#resetExtruderLength:
-				tool = self._activeTool
-				if self._extrusionMode == self.EXTRUSION_MODE_ABSOLUTE:
-					# We add what we have to the total for the his tool head
-					self._consumedFilament[tool] += ( self._lastExtrusion[tool] - self._lastExtruderLengthReset[tool] )
+			except Exception:
+				self._logger.error("Error counting material", exc_info= True)
 
-				self._lastExtruderLengthReset[tool] = eValue
-				self._lastExtrusion[tool] = eValue
+	def _closeSegment(self):
+		if self._extrusionMode == self.EXTRUSION_MODE_ABSOLUTE:
+			self._consumedFilament[self._activeTool] += self._e - self._segmentStart
 
+		self._segmentStart = self._e
 
-	def _gcode_G0(self, cmd):
-		if 'E' in cmd:
-			match = self._regex_paramEFloat.search(cmd)
-			if match:
-				try:
-					#reportExtrusion
-					length = float(match.group(1))
-					if self._extrusionMode == self.EXTRUSION_MODE_RELATIVE:
-						#if length > 0: #never report retractions
-						self._consumedFilament[self._activeTool] += length
+	def _gcode_T(self, cmd): #changeActiveTool
+		tool = commandParam(cmd, "T", 0)
+		if tool is not None:
+			newTool = str(int(tool))
+			if self._activeTool != newTool:
+				#What was extruded so far belongs to the previous tool
+				self._closeSegment()
+				if newTool not in self._consumedFilament:
+					self._consumedFilament[newTool] = 0.0
 
-					else: # EXTRUSION_MODE_ABSOLUTE
-						tool = self._activeTool
+				self._activeTool = newTool
 
-						#if length > self._lastExtrusion[tool]: #never report retractions
-						self._lastExtrusion[tool] = length
+	def _gcode_G92(self, cmd):
+		eValue = None
+		if cmd.strip() == 'G92': #A simple G92 command resets all axis so E is now set to 0
+			eValue = 0.0
+		elif 'E' in cmd:
+			eValue = commandParam(cmd, "E")
+
+		if eValue is not None:
+			#There has been an E reset
+			self._closeSegment()
+			self._e = eValue
+			self._segmentStart = eValue
 
-				except ValueError:
-					pass
+	def _gcode_G0(self, cmd):
+		length = commandParam(cmd, "E")
+		if length is not None:
+			#reportExtrusion
+			if self._extrusionMode == self.EXTRUSION_MODE_RELATIVE:
+				self._consumedFilament[self._activeTool] += length
+				self._e += length
 
+			else: # EXTRUSION_MODE_ABSOLUTE
+				self._e = length
 
 	_gcode_G1 = _gcode_G0
 
 	def _gcode_M82(self, cmd): #Set to absolute extrusion mode
-		self._extrusionMode = self.EXTRUSION_MODE_ABSOLUTE
-
+		if self._extrusionMode != self.EXTRUSION_MODE_ABSOLUTE:
+			self._extrusionMode = self.EXTRUSION_MODE_ABSOLUTE
+			self._segmentStart = self._e
 
 	def _gcode_M83(self, cmd): #Set to relative extrusion mode
-		self._extrusionMode = self.EXTRUSION_MODE_RELATIVE
-		tool = self._activeTool
 		#it was absolute before so we add what we had to the active head counter
-		self._consumedFilament[tool] += ( self._lastExtrusion[tool] - self._lastExtruderLengthReset[tool] )
-
+		self._closeSegment()
+		self._extrusionMode = self.EXTRUSION_MODE_RELATIVE
 
 	# In Marlin G91 and G90 also change the relative nature of extrusion
 	_gcode_G90 = _gcode_M82 #Set Absolute
@@ -6,16 +6,23 @@ __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agp
 __copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
 
 import time
+import mmap
+import threading
 
 from octoprint.printer import PrinterCallback
 from octoprint_astroprint.gCodeAnalyzer import GCodeAnalyzer
 
+#The socket info is sent for layer changes at most once every this many secs, the ones in between are left for the
+#last of them. The camera is told about every change.
+LAYER_NOTIFY_INTERVAL = 2.0
+
 class PrinterListener(PrinterCallback):
 
 	def __init__(self, plugin):
 		self.cameraManager = None
 		self.astroprintCloud = None
 		self._analyzed_job_layers = None
+		self._analyzed_file = None
 
 		self._router = None
 		self._plugin = plugin
@@ -24,12 +31,23 @@ class PrinterListener(PrinterCallback):
 		self._progress = None
 		self._state = None
 		self._job_data = None
+		self._job_data_key = None
 		self._currentLayer = None
-		self._timePercentPreviuosLayers = None
 		self.last_layer_time_percent = None
 		self._last_time_send = None
 		self._printStartedAt = None
-
+		self.timerCalculator = None
+		self._layerChanges = 0
+		self._layerChangesLock = threading.Lock()
+		self._layerChanged = threading.Event()
+		self._shutdown = False
+		self._layerWorker = threading.Thread(target=self._notifyLayers, name="Layer Notifications")
+		self._layerWorker.daemon = True
+		self._layerWorker.start()
+
+	def shutdown(self):
+		self._shutdown = True
+		self._layerChanged.set()
 
 	def addWatcher(self, socket):
 		self._router = socket
@@ -44,42 +62,136 @@ class PrinterListener(PrinterCallback):
 		return self._analyzed_job_layers
 
 	def startPrint(self, file):
+			#An analysis still going on for a previous print is not needed anymore
+			self.cancelAnalysis()
 			self._analyzed_job_layers = None
+			self._analyzed_file = file
 			self._currentLayer = 0
 			self.last_layer_time_percent = 0
-			self._timePercentPreviuosLayers = 0
 			self._printStartedAt = None
-			self.timerCalculator = GCodeAnalyzer(file,True,self.cbGCodeAnalyzerReady,self.cbGCodeAnalyzerFail,self, self._plugin)
+			self.timerCalculator = GCodeAnalyzer(file,True,self.cbGCodeAnalyzerReady,self.cbGCodeAnalyzerFail,self, self._plugin, partialCallback=self.cbGCodeAnalyzerPartial)
 			self.timerCalculator.makeCalcs()
 
+	def cancelAnalysis(self):
+		if self.timerCalculator:
+			self.timerCalculator.cancel()
+			self.timerCalculator = None
+
 	def cbGCodeAnalyzerReady(self,timePerLayers,totalPrintTime,layerCount,size,layer_height,total_filament,parent):
 		self._analyzed_job_layers = {}
 		self._analyzed_job_layers["timePerLayers"] = timePerLayers
 		self._analyzed_job_layers["layerCount"] = layerCount
-		self._analyzed_job_layers["totalPrintTime"] = totalPrintTime*1.07
+		self._analyzed_job_layers["totalPrintTime"] = totalPrintTime
+
+		#The filament consumed is known from the position in the file from now on
+		materialCounter = self._plugin.materialCounter
+		if materialCounter and self.timerCalculator and self.timerCalculator.filamentTimeline:
+			materialCounter.setFilamentTimeline(self.timerCalculator.filamentTimeline)
+
+	def cbGCodeAnalyzerPartial(self,timePerLayers,totalPrintTime,layerCount,size,layer_height,total_filament,parent):
+		#Used until the complete analysis arrives, the layer count isn't known yet
+		if self._analyzed_job_layers and not self._analyzed_job_layers.get("partial"):
+			return
+
+		self._analyzed_job_layers = {
+			"timePerLayers": timePerLayers,
+			"layerCount": None,
+			"totalPrintTime": totalPrintTime,
+			"partial": True
+		}
 
 	def cbGCodeAnalyzerFail(self, parameters):
 		self._logger.error("Fail to analyze Gcode: %s" % parameters['filename'])
 
-	def updateAnalyzedJobInformation(self, progress):
-		#analyzedInformation = {"current_layer" : 0, "time_percent_previuos_layers" : 0}
-		layerChanged = False
+	def get_layer_gcode(self, layer):
+		# GCode of a 1 based layer of the file printing, None when it's not known where the layer is
+		layers = self._analyzed_job_layers["timePerLayers"] if self._analyzed_job_layers else None
+		if not layers or layers.start is None or not self._analyzed_file or layer < 1 or layer > len(layers):
+			return None
+
+		if self._analyzed_job_layers.get("partial") and layer == len(layers):
+			#Still being analyzed, its end isn't known yet
+			return None
+
+		start, end = layers.layerRange(layer)
+		try:
+			with open(self._analyzed_file, "rb") as f:
+				mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+				try:
+					return mm[start:end]
+				finally:
+					mm.close()
+
+		except (IOError, ValueError):
+			self._logger.error("Unable to read layer %d of %s" % (layer, self._analyzed_file), exc_info= True)
+			return None
+
+	def updateAnalyzedJobInformation(self, progress, filePos=None):
 		if not self._currentLayer:
 			self._currentLayer = 1
 
-		if self._analyzed_job_layers:
-			while self._analyzed_job_layers["timePerLayers"][self._currentLayer -1]['upperPercent'] < progress:
-				layerChanged = True
-				self._currentLayer+=1
+		if self._analyzed_job_layers and self._analyzed_job_layers["timePerLayers"]:
+			#The layer is looked up from scratch so it stays right when progress goes backwards or skips layers. The
+			#file position gives the exact one when the analysis has the layer offsets.
+			layers = self._analyzed_job_layers["timePerLayers"]
+			if filePos is not None and layers.start is not None:
+				layer = layers.layerAtOffset(filePos)
+			else:
+				layer = layers.layerAt(progress)
+
+			if layer != self._currentLayer:
+				self._currentLayer = layer
+				self.notifyLayerChanged()
+
+	def liveLayerChanged(self, layer, z):
+		# Called by the LayerTracker, in the thread sending to the printer, when the commands sent start a new layer.
+		# It's only used while there's no analysis, the analysis has the last word once it arrives.
+		if self._analyzed_job_layers and self._analyzed_job_layers["timePerLayers"]:
+			return
+
+		if not (self._printer.is_printing() or self._printer.is_paused()):
+			return
+
+		if layer != self._currentLayer:
+			self._currentLayer = layer
+			self.notifyLayerChanged()
+
+	def notifyLayerChanged(self):
+		# Called in the printer threads, the photo upload and the socket info are left to the layer notifications thread
+		with self._layerChangesLock:
+			self._layerChanges += 1
+
+		self._layerChanged.set()
+
+	def _notifyLayers(self):
+		self._plugin.get_resource_policy().applyToCurrentThread("Layer Notifications")
+
+		socketInfoSent = 0.0
+		socketInfoPending = False
+		while not self._shutdown:
+			#Woken up by the next change, or when the socket info held back can be sent
+			self._layerChanged.wait(max(socketInfoSent + LAYER_NOTIFY_INTERVAL - time.time(), 0) if socketInfoPending else None)
+			self._layerChanged.clear()
+			if self._shutdown:
+				break
+
+			with self._layerChangesLock:
+				layerChanges = self._layerChanges
+				self._layerChanges = 0
 
-			if layerChanged:
-				if not self._currentLayer == 1:
-					self._timePercentPreviuosLayers += self._analyzed_job_layers["timePerLayers"][self._currentLayer -2 ]['time']
-				else:
-					self._timePercentPreviuosLayers = 0
+			try:
+				#Every change gets its photo, the ones made while the last photo was taken can't have their own
+				if layerChanges and self.cameraManager:
+					self.cameraManager.layerChanged(layerChanges)
+
+				socketInfoPending = socketInfoPending or layerChanges > 0
+				if socketInfoPending and time.time() >= socketInfoSent + LAYER_NOTIFY_INTERVAL:
+					socketInfoPending = False
+					socketInfoSent = time.time()
+					self._plugin.sendSocketInfo()
 
-				self.cameraManager.layerChanged()
-				self._plugin.sendSocketInfo()
+			except Exception:
+				self._logger.error("Error notifying the layer change", exc_info= True)
 
 	def on_printer_add_temperature(self, data):
 		if self._router:
@@ -88,10 +200,7 @@ class PrinterListener(PrinterCallback):
 			if 'bed' in data:
 				payload['bed'] = { 'actual': data['bed']['actual'], 'target': data['bed']['target'] }
 
-			dataProfile = self._plugin._printer_profile_manager.get_current_or_default()
-			extruder_count = dataProfile['extruder']['count']
-			for i in range(extruder_count):
-				tool = 'tool'+str(i)
+			for tool in self._plugin.settingsSnapshot.toolKeys:
 				if tool in data:
 					payload[tool] = { 'actual': data[tool]['actual'], 'target': data[tool]['target'] }
 
@@ -123,6 +232,9 @@ class PrinterListener(PrinterCallback):
 
 
 	def set_job_data(self, data):
+		#The payload only changes with the file, its analysis (OctoPrint's estimate, filament and the layer count) or
+		#its print file in the catalog, often saved after the file is selected. It's not built again on every update,
+		#the catalog lookup is cheap (indexed by path) and done every time.
 		if data['file']['name'] and data['file']['size']:
 			renderedImage = None
 			cloudId = None
@@ -131,6 +243,20 @@ class PrinterListener(PrinterCallback):
 				if cloudPrintFile:
 					renderedImage = cloudPrintFile.renderedImage
 					cloudId = cloudPrintFile.printFileId
+
+			key = (
+				data['file']['origin'], data['file']['path'], data['file']['size'], data['file']['date'],
+				data['estimatedPrintTime'], data['filament'], self._analyzed_job_layers['layerCount'] if self._analyzed_job_layers else None,
+				renderedImage, cloudId
+			)
+		else:
+			key = None
+
+		if key == self._job_data_key:
+			return
+
+		self._job_data_key = key
+		if key:
 			payload = {
 				"estimatedPrintTime": data['estimatedPrintTime'],
 				"layerCount": self._analyzed_job_layers['layerCount'] if self._analyzed_job_layers else None,
@@ -178,17 +304,19 @@ class PrinterListener(PrinterCallback):
 		if not self._printStartedAt:
 			self._printStartedAt = payload['printTime']
 		if not self._analyzed_job_layers:
-			payload['currentLayer'] = 0
+			#Layers followed from the commands sent until the analysis arrives
+			payload['currentLayer'] = self._currentLayer or 0
 			return payload
 		else:
-			self.updateAnalyzedJobInformation(payload['completion']/100)
+			self.updateAnalyzedJobInformation(payload['completion']/100, payload.get('filepos'))
 			payload['currentLayer'] = self._currentLayer
 
 			try:
-				layerFileUpperPercent = self._analyzed_job_layers["timePerLayers"][self._currentLayer-1]['upperPercent']
+				layers = self._analyzed_job_layers["timePerLayers"]
+				layerFileUpperPercent = layers.upperPercent[self._currentLayer-1]
 
 				if self._currentLayer > 1:
-					layerFileLowerPercent = self._analyzed_job_layers["timePerLayers"][self._currentLayer-2]['upperPercent']
+					layerFileLowerPercent = layers.upperPercent[self._currentLayer-2]
 				else:
 					layerFileLowerPercent = 0
 
@@ -200,9 +328,9 @@ class PrinterListener(PrinterCallback):
 				except:
 					currentLayerPercent = 0
 
-				layerTimePercent = currentLayerPercent * self._analyzed_job_layers["timePerLayers"][self._currentLayer-1]['time']
+				layerTimePercent = currentLayerPercent * layers.time[self._currentLayer-1]
 
-				currentTimePercent = self._timePercentPreviuosLayers + layerTimePercent
+				currentTimePercent = layers.timeBefore[self._currentLayer-1] + layerTimePercent
 
 				estimatedTimeLeft = self._analyzed_job_layers["totalPrintTime"] * ( 1.0 - currentTimePercent )
 
@@ -0,0 +1,194 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+import os
+import signal
+import shutil
+import threading
+import subprocess
+
+def killProcess(process):
+	# Processes are started in their own session so the processes they start (the analyzer pool) are killed with them
+	try:
+		os.killpg(process.pid, signal.SIGKILL)
+
+	except OSError:
+		try:
+			process.kill()
+
+		except OSError:
+			pass
+
+class ResourcePolicy(object):
+	# Keeps the plugin background work (analyzer process and worker threads) from competing with OctoPrint's serial
+	# communication: nice level, io scheduling class and CPU affinity for both, memory and time limits for the
+	# analyzer process. It's read from the resource_policy setting every time so changes apply to new work.
+
+	IO_CLASS_BEST_EFFORT = 2
+	IO_CLASS_IDLE = 3
+
+	#Exit code used by our own processes when they run out of memory
+	EXIT_OUT_OF_MEMORY = 3
+
+	def __init__(self, plugin):
+		self.plugin = plugin
+		self._logger = plugin.get_logger()
+		self._settings = plugin.get_settings()
+		self._ionice = shutil.which("ionice")
+		self._nice = shutil.which("nice")
+		self._taskset = shutil.which("taskset")
+		self._prlimit = shutil.which("prlimit")
+		self.limitsReached = 0
+
+	def _get(self, key):
+		return self._settings.get(["resource_policy", key])
+
+	@property
+	def enabled(self):
+		return bool(self._get("enabled"))
+
+	@property
+	def cpuAffinity(self):
+		cpus = self._get("cpu_affinity")
+		return set(int(cpu) for cpu in cpus) if cpus else None
+
+	@property
+	def memoryLimit(self):
+		#bytes, None for no limit
+		limit = self._get("analyzer_memory_limit")
+		return int(limit) * 1024 * 1024 if limit else None
+
+	@property
+	def timeLimit(self):
+		#seconds, None for no limit
+		limit = self._get("analyzer_time_limit")
+		return int(limit) if limit else None
+
+	def ioniceCommand(self, pid=None):
+		if not self._ionice or not self._get("io_class"):
+			return []
+
+		ioClass = int(self._get("io_class"))
+		command = [self._ionice, "-c", str(ioClass)]
+		if ioClass == self.IO_CLASS_BEST_EFFORT:
+			command += ["-n", str(self._get("io_priority"))]
+		if pid:
+			command += ["-p", str(pid)]
+
+		return command
+
+	def applyToCurrentThread(self, name):
+		# Linux schedules threads independently, so nice level, affinity and io class can be set per thread id
+		if not self.enabled or not hasattr(threading, "get_native_id"):
+			return
+
+		tid = threading.get_native_id()
+
+		try:
+			if hasattr(os, "setpriority"):
+				os.setpriority(os.PRIO_PROCESS, tid, int(self._get("nice")))
+
+			if self.cpuAffinity and hasattr(os, "sched_setaffinity"):
+				os.sched_setaffinity(tid, self.cpuAffinity)
+
+			ionice = self.ioniceCommand(tid)
+			if ionice:
+				subprocess.call(ionice, close_fds=True)
+
+		except (OSError, ValueError) as e:
+			self._logger.warn("Unable to apply the resource policy to %s: %s" % (name, e))
+
+	def processCommand(self, command):
+		# The command is run through ionice, nice, taskset and prlimit, the ones available, to set the io class, nice
+		# level, affinity and limits of the process. Each of them execs the next one so the process keeps its pid.
+		# Nothing is run in the child between fork and exec, that isn't safe with the threads of OctoPrint.
+		if not self.enabled:
+			return command
+
+		wrappers = self.ioniceCommand()
+
+		if self._nice and hasattr(os, "getpriority"):
+			#nice adds to the nice level inherited from the thread starting the process
+			increment = int(self._get("nice")) - os.getpriority(os.PRIO_PROCESS, 0)
+			if increment:
+				wrappers += [self._nice, "-n", str(increment)]
+
+		cpus = self.cpuAffinity
+		if cpus and self._taskset:
+			wrappers += [self._taskset, "-c", ",".join(str(cpu) for cpu in sorted(cpus))]
+
+		limits = []
+		if self.memoryLimit:
+			limits.append("--as=%d" % self.memoryLimit)
+		if self.timeLimit:
+			#CPU time can't be longer than wall time, the process gets SIGXCPU if it is
+			limits.append("--cpu=%d:%d" % (self.timeLimit, self.timeLimit + 5))
+		if limits and self._prlimit:
+			wrappers += [self._prlimit] + limits
+
+		return wrappers + command
+
+	def runProcess(self, name, command, onStart=None, onOutput=None):
+		# Runs the command with the policy applied and waits for it. Returns (returncode, stdout), (None, None) when it
+		# couldn't be started. With onOutput, it's called with the stdout stream to read it as it's written and what it
+		# returns is given instead of stdout.
+		try:
+			process = subprocess.Popen(self.processCommand(command), stdout=subprocess.PIPE, close_fds=True, start_new_session=True)
+
+		except OSError:
+			return None, None
+
+		if onStart:
+			onStart(process)
+
+		timeLimit = self.timeLimit if self.enabled else None
+		expired = threading.Event()
+		timer = None
+
+		if timeLimit:
+			def expire():
+				expired.set()
+				killProcess(process)
+
+			timer = threading.Timer(timeLimit, expire)
+			timer.daemon = True
+			timer.start()
+
+		try:
+			if onOutput:
+				try:
+					stdout = onOutput(process.stdout)
+
+				except Exception:
+					killProcess(process)
+					raise
+
+				finally:
+					process.stdout.close()
+					process.wait()
+
+			else:
+				stdout, _ = process.communicate()
+
+		finally:
+			if timer:
+				timer.cancel()
+
+		if expired.is_set():
+			self.limitReached(name, "time limit of %d secs" % timeLimit)
+		elif process.returncode == -signal.SIGXCPU:
+			self.limitReached(name, "CPU time limit of %d secs" % timeLimit)
+		elif self.enabled and self.memoryLimit and process.returncode in (self.EXIT_OUT_OF_MEMORY, -signal.SIGSEGV, -signal.SIGABRT):
+			#Running out of address space makes allocations fail, the native analyzer doesn't survive that
+			self.limitReached(name, "memory limit of %d MB" % (self.memoryLimit // (1024 * 1024)))
+
+		return process.returncode, stdout
+
+	def limitReached(self, name, limit):
+		self.limitsReached += 1
+		self._logger.warn("%s was stopped after reaching the %s" % (name, limit))
+		self.plugin.send_event("resourceLimitReached", {'name': name, 'limit': limit})
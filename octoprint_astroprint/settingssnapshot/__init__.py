@@ -0,0 +1,66 @@
+# coding=utf-8
+from __future__ import absolute_import,   unicode_literals
+
+__author__ = "AstroPrint Product Team <product@astroprint.com>"
+__license__ = "GNU Affero General Public License http://www.gnu.org/licenses/agpl.html"
+__copyright__ = "Copyright (C) 2018-2025 PRINTANDGO AM SOLUTIONS SL - Released under terms of the AGPLv3 License"
+
+from copy import deepcopy
+
+class SettingsSnapshot(object):
+	# Plugin settings and printer profile values read by the temperature, state and status updates. It's built at
+	# once and never modified, when the settings or the profile change a new one replaces it, so the threads reading
+	# it only need to take the current one, without locks.
+	__slots__ = (
+		'extruderCount', 'toolKeys', 'heatedBed', 'invertZ',
+		'maxNozzleTemp', 'maxBedTemp', 'printerModel', 'filament', 'checkClearBed', 'boxName',
+		'flipH', 'flipV', 'rotate90', 'temperatureDeadbands', 'temperatureInterval'
+	)
+
+	def __init__(self, settings, printerProfile):
+		printerModel = settings.get(["printerModel"])
+		toolKeys = tuple('tool%d' % i for i in range(printerProfile['extruder']['count']))
+
+		#Deadband of every sensor, tool0, tool1... fall back to the one for all the tools
+		deadbands = settings.get(["temperature_updates", "deadband"]) or {}
+		temperatureDeadbands = dict((sensor, float(deadbands.get(sensor, deadbands.get('tool', 0.0)))) for sensor in toolKeys)
+		temperatureDeadbands['bed'] = float(deadbands.get('bed', 0.0))
+		maxRate = settings.get_float(["temperature_updates", "max_rate"])
+
+		values = {
+			'extruderCount': printerProfile['extruder']['count'],
+			'toolKeys': toolKeys,
+			'heatedBed': printerProfile['heatedBed'],
+			'invertZ': printerProfile['axes']['z']['inverted'],
+			'maxNozzleTemp': settings.get(["max_nozzle_temp"]),
+			'maxBedTemp': settings.get(["max_bed_temp"]),
+			'printerModel': deepcopy(printerModel) if printerModel and printerModel['id'] else None,
+			'filament': deepcopy(settings.get(["filament"])),
+			'checkClearBed': bool(settings.get(["check_clear_bed"])),
+			'boxName': settings.get(["boxName"]),
+			'flipH': settings.global_get(["webcam", "flipH"]),
+			'flipV': settings.global_get(["webcam", "flipV"]),
+			'rotate90': settings.global_get(["webcam", "rotate90"]),
+			'temperatureDeadbands': temperatureDeadbands,
+			'temperatureInterval': 1.0 / maxRate if maxRate and maxRate > 0 else 0.0
+		}
+
+		for name, value in values.items():
+			object.__setattr__(self, name, value)
+
+	def __setattr__(self, name, value):
+		raise AttributeError("SettingsSnapshot is immutable")
+
+	def profile(self, printerModelKey='printerModel'):
+		# Printer profile as sent to AstroPrint
+		return {
+			'driver': "marlin", #At the moment octopi only supports marlin
+			'extruder_count': self.extruderCount,
+			'max_nozzle_temp': self.maxNozzleTemp,
+			'max_bed_temp': self.maxBedTemp,
+			'heated_bed': self.heatedBed,
+			'cancel_gcode': ['G28 X0 Y0'],#ToDo figure out how to get it from snipet
+			'invert_z': self.invertZ,
+			printerModelKey: self.printerModel,
+			'filament' : self.filament
+		}
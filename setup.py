@@ -34,7 +34,6 @@ plugin_license = "AGPLv3"
 
 # Any additional requirements besides OctoPrint should be listed here
 plugin_requires = [
-  "ws4py==0.3.4",
   "requests-toolbelt==0.10.1",
   "Pillow",
   "urllib3<2.0.0",
@@ -67,7 +66,12 @@ plugin_ignored_packages = []
 #     plugin_requires = ["someDependency==dev"]
 #     additional_setup_parameters = {"dependency_links": ["https://github.com/someUser/someRepo/archive/master.zip#egg=someDependency-dev"]}
 
-additional_setup_parameters = {}
+# NumPy lets the python GCode analyzer plan the moves for closer print times, install the plugin with [planner] for it
+additional_setup_parameters = {
+	"extras_require": {
+		"planner": ["numpy"]
+	}
+}
 ########################################################################################################################
 
 from setuptools import setup